@@ -1,12 +1,10 @@
 from collections import namedtuple
 
 import os
-from lxml import etree, objectify
 from collections import defaultdict
 from xml.etree import cElementTree as ET, cElementTree
-from xml.dom.minidom import parseString
 
-from skimage.measure import find_contours, approximate_polygon, subdivide_polygon
+# Note: lxml, minidom and skimage.io are imported by the functions that need them, to keep the import of this module fast
 
 try:
   basestring
@@ -14,8 +12,20 @@ except NameError:  # python3
   basestring = str
 
 import numpy as np
-from skimage.draw import polygon
-from skimage.io import imread
+
+try:  # python 2
+    from smoothing import smooth_loops
+except:  # python 3
+    from .smoothing import smooth_loops
+
+try:  # python 2
+    from tracing import trace_contours
+    from polygons import fill_even_odd, polygon_hierarchy, approximate_polygons
+    from section_io import open_section
+except:  # python 3
+    from .tracing import trace_contours
+    from .polygons import fill_even_odd, polygon_hierarchy, approximate_polygons
+    from .section_io import open_section
 
 SECTION_DTD_FILENAME = os.path.join(os.path.dirname(__file__), "SECTION.DTD")
 SERIES_DTD_FILENAME = os.path.join(os.path.dirname(__file__), "SERIES.DTD")
@@ -25,17 +35,17 @@ def verify_files(xml_file, dtd_file):
     """
     Verify xml file against dtd file, given by file handles.
     """
+    from lxml import etree, objectify
     dtd = etree.DTD(dtd_file)
     tree = objectify.parse(xml_file)
     return dtd.validate(tree)
 
 def verify(xml_filename, dtd_filename):
     """
-    Verify xml file against dtd file, given by filenames.
+    Verify xml file against dtd file, given by filenames (the xml file may be compressed, see section_io).
     """
-    dtd_file = open(dtd_filename, 'rb')
-    xml_file = open(xml_filename, 'rb')
-    return verify_files(xml_file, dtd_file)
+    with open(dtd_filename, 'rb') as dtd_file, open_section(xml_filename, 'rb') as xml_file:
+        return verify_files(xml_file, dtd_file)
 
 # The following two function based on the answers posted on stackoverflow by K3--rnc (2012, 2016)
 # http://stackoverflow.com/questions/2148119/how-to-convert-an-xml-string-to-a-dictionary-in-python
@@ -108,6 +118,7 @@ def prettify(rough_string):
     """
     Return a pretty-printed XML string by indentation and new lines.
     """
+    from xml.dom.minidom import parseString
     reparsed = parseString(rough_string)
     return reparsed.toprettyxml(indent="\t")
 
@@ -120,7 +131,7 @@ def convert_attribute_from_string (key, value):
     """
     # <!ENTITY % SFBool   "(true|false)"> <!-- a single field Boolean -->
     if value=='true' or value =='false':
-        return bool(value)
+        return value == 'true'
 
     # <!ENTITY % SFInt32  "CDATA">        <!-- a single 32-bit integer -->
     # if key in ['index', 'mode', 'dim']:
@@ -141,7 +152,7 @@ def convert_attribute_from_string (key, value):
     # # <!ENTITY % MFVec2f  "CDATA">        <!-- an array of pairs of floats -->
     # if key in ['points']:  # split points on "," and coordinates on " "
     if ',' in value:
-        points = map(lambda x: map(float, x.split()), value.split(','))
+        points = [[float(x) for x in point.split()] for point in value.split(',')]
         if points[-1] == []:  # Remove empty coordinate pair introduced by a trailing "," (as in original xml files!)
             points.pop()
         return np.array(points)
@@ -150,7 +161,7 @@ def convert_attribute_from_string (key, value):
     # <!ENTITY % MFFloat  "CDATA">        <!-- an array of floats -->
     # if key in ['xcoef', 'ycoef', 'border', 'fill']:
     if ' ' in value:
-        return np.array(map(float, value.split()))
+        return np.array([float(x) for x in value.split()])
 
     # <!ENTITY % SFString "CDATA">        <!-- a string of characters excluding '/','<','>','"' -->
     return value
@@ -196,8 +207,8 @@ def read_section_dict(dictionary):
     try:
     # if 'Contour' in dictionary['Section']['Transform'][i].keys():
         contours_transform = attributes_to_named_tuple('Transforms', dictionary['Section']['Transform'][i])
-        contours = map(lambda x: attributes_to_named_tuple('Contours', x),
-                       dictionary['Section']['Transform'][i]['Contour'])
+        contours = [attributes_to_named_tuple('Contours', x)
+                    for x in dictionary['Section']['Transform'][i]['Contour']]
     except:
     # else:
         # No contours described  in xml
@@ -264,24 +275,52 @@ SectionAttrib = namedtuple('Section', ['alignLocked', 'index', 'thickness'])
 DefaultSection = SectionAttrib (False, -1, 0.05)
 
 
-def convert_attribute_to_string(key, value):
+def format_numbers(values, significant_digits, separator=" ", point_separator=", "):
+    """
+    Format an array of numbers or of points with a fixed number of significant digits (as significantDigits of
+    SERIES.DTD). All numbers are formatted at once by a single format string.
+    :param values: array of numbers with shape (n,) or of points with shape (n, 2)
+    :param significant_digits: number of significant digits
+    :param separator: separator of numbers (of the coordinates of a point)
+    :param point_separator: separator of points
+    :return: string
+    """
+    if significant_digits < 0:
+        raise ValueError("significant_digits must be at least 0, got %d" % significant_digits)
+    values = np.asarray(values)
+    number = "%%.%dg" % significant_digits
+    if values.ndim == 2:
+        template = (separator.join([number] * values.shape[1]) + point_separator) * values.shape[0]
+        template = template[:len(template) - len(point_separator)]
+    else:
+        template = separator.join([number] * values.size)
+    return template % tuple(values.ravel().tolist())
+
+
+def convert_attribute_to_string(key, value, significant_digits=None):
     """
     Convert attributes to strings, depending on the key and value type
+    :param significant_digits: number of significant digits of arrays of numbers and points, None for full precision
     """
     if isinstance(value, bool):    # Note: make sure boolean is lower case as %SFBool
         return str(value).lower()
     if key in ['xcoef', 'ycoef', 'border', 'fill']:   # arrays of numbers
+        if significant_digits is not None:
+            return format_numbers(value, significant_digits)
         return " ".join(map(str, value))
     if key in ['points']:   # coordinates separated with " ", points with ", "
+        if significant_digits is not None:
+            return format_numbers(value, significant_digits, " ", ", ")
         return ", ".join(map(lambda x: " ".join(map(str, x)), value))
     return str(value)
 
 
-def attributes_to_dict(named_tuple):
+def attributes_to_dict(named_tuple, significant_digits=None):
     """
     Convert the attributes given as a named tuple into a dictionary with names as key.
+    :param significant_digits: number of significant digits of arrays of numbers and points, None for full precision
     """
-    return {"@"+k: convert_attribute_to_string(k,v)
+    return {"@"+k: convert_attribute_to_string(k, v, significant_digits)
             for k, v in named_tuple._asdict().items() if v is not None }
 
 
@@ -290,7 +329,8 @@ def make_section_dict(section=DefaultSection,
                       image_contour=ExampleImageContour,
                       image_transform=DefaultTransform,
                       contours=TwoExampleDendriteContours,
-                      contour_transform = DefaultTransform):
+                      contour_transform = DefaultTransform,
+                      significant_digits=None):
     """
     Convert section tracing data to XML.
     Note: Assuming that all contours share the same transformation. That must not always be the case!
@@ -300,20 +340,21 @@ def make_section_dict(section=DefaultSection,
     :param image_transform: named tuple containing the image transform attributes
     :param contours: a list of named tuples containing contour attributes, e.g. name and points
     :param contour_transform: named tuple containing the transform attributes applied to contours
+    :param significant_digits: number of significant digits of points and coefficients, None for full precision
     :return: dictionary of the section for conversion to xml
     """
     transform_list = []
 
     # <!ELEMENT Transform ((Image,Contour)|Contour+) >
     # Case 1: Transform contains Image and Contour
-    transform_list.append(attributes_to_dict(image_transform))
-    transform_list[0]['Image'] = [attributes_to_dict(image)]
-    transform_list[0]['Contour'] = [attributes_to_dict(image_contour)]
+    transform_list.append(attributes_to_dict(image_transform, significant_digits))
+    transform_list[0]['Image'] = [attributes_to_dict(image, significant_digits)]
+    transform_list[0]['Contour'] = [attributes_to_dict(image_contour, significant_digits)]
 
     # <!ELEMENT Transform ((Image,Contour)|Contour+) >
     # Case 2: Transform contains Image and Contour
-    transform_list.append(attributes_to_dict(contour_transform))
-    transform_list[1]['Contour'] = map(attributes_to_dict, contours)
+    transform_list.append(attributes_to_dict(contour_transform, significant_digits))
+    transform_list[1]['Contour'] = [attributes_to_dict(contour, significant_digits) for contour in contours]
 
     # < !ELEMENT    Section(Transform +) >
     section_dict = attributes_to_dict(section)
@@ -322,7 +363,23 @@ def make_section_dict(section=DefaultSection,
     return {'Section': section_dict}
 
 
-def xml_to_label_dict(xml_filename):
+def read_section(xml_file):
+    """
+    Read a section xml file and extract the data as named tuples (for explanation see read_section_dict).
+    :param xml_file: path of xml file (compressed if it ends with .gz or .zst, see section_io) or binary file object,
+                     e.g. a member of an archive
+    :return: section, image, image_contour, image_transform, contours, contours_transform
+    """
+    if isinstance(xml_file, basestring):
+        with open_section(xml_file, 'rb') as f:
+            e = ET.parse(f).getroot()
+    else:
+        e = ET.parse(xml_file).getroot()
+    d = etree_to_dict(e)
+    return read_section_dict(d)
+
+
+def xml_to_label_dict(xml_file, image_dir=None):
     """
     Converts xml with contours to dictionary of label images.
     Notes:
@@ -330,17 +387,41 @@ def xml_to_label_dict(xml_filename):
     - Points of the contour (domain) of the image are given in pixels (!) and must be convert by image
       attribute mag (magnification) which states the pixel width in micrometer
     - image must be at (0,0)
-    :param xml_filename: path of xml file
+    :param xml_file: path of xml file (may be compressed) or binary file object (see read_section)
+    :param image_dir: directory of the annotated image, by default the directory of the xml file
     :return: labels: dictionary of label images with contour.name as key
              source_image: annotated image if available
     """
-    e = open(xml_filename, 'r').read()
-    e = ET.XML(e)
-    d = etree_to_dict(e)
-    section, image, image_contour, image_transform, contours, contours_transform = read_section_dict(d)
+    section, image, image_contour, image_transform, contours, contours_transform = read_section(xml_file)
 
     assert image_transform.dim == 0 and contours_transform.dim == 0
 
+    labels = contours_to_label_dict(contours, image, image_contour)
+
+    # try reading annotated image and check shape is correct
+    minr, minc, maxr, maxc = bbox(image_contour.points)
+    source_image = np.zeros((maxr + 1, maxc + 1), dtype=np.uint8)   # black 8 bit image, if the image is missing
+    if image_dir is None and isinstance(xml_file, basestring):
+        image_dir = os.path.dirname(xml_file)
+    if image.src and image_dir is not None:
+        image_file = os.path.join(image_dir, image.src)
+        if os.path.isfile(image_file):
+            from skimage.io import imread
+            source_image = imread(image_file)
+            assert source_image.shape == (maxr + 1, maxc + 1)
+
+    return labels, source_image
+
+
+def contours_to_label_dict(contours, image, image_contour, names=None):
+    """
+    Plot contours on label images indexed by the name of the contour.
+    :param contours: list of contours (named tuples as returned by read_section_dict)
+    :param image: named tuple containing image attributes, the attribute mag is the pixel width in micrometer
+    :param image_contour: named tuple containing the corner points of the image (in pixels)
+    :param names: names of the contours to plot, if None plot all contours
+    :return: labels: dictionary of label images with contour.name as key
+    """
     pixel_size = image.mag  # in micrometer
 
     minr, minc, maxr, maxc = bbox(image_contour.points)
@@ -349,26 +430,39 @@ def xml_to_label_dict(xml_filename):
     # Make empty label map
     empty_label = np.zeros((maxr + 1, maxc + 1))
 
-    # try reading annotated image and check shape is correct
-    source_image = empty_label.copy()
-    if image.src:
-        image_file = os.path.join(os.path.dirname(xml_filename), image.src)
-        if os.path.isfile(image_file):
-            source_image = imread(image_file)
-            assert source_image.shape == empty_label.shape
-
-    # Iterate over all contours and plot them on a label image indexed by the name of the contour
+    # Collect all contours by name and plot them on a label image indexed by the name of the contour
     # Note: Disconnected cross sections contours of the same object are draw on the the same label image.
-    labels = dict()
+    #       Contours are filled with the even-odd rule, so contours within contours of the same name are holes.
+    loops = defaultdict(list)
     for contour in contours:
-        if contour.name not in labels.keys():
-            labels[contour.name] = empty_label.copy()
+        if names is not None and contour.name not in names:
+            continue
         r = maxr - contour.points[:, 1] / pixel_size  # pixel row from y coordinates; image y axis inverted
         c = contour.points[:, 0] / pixel_size  # pixel column from x coordinates
-        rr, cc = polygon(r, c, shape=(maxr, maxc))   # shape restrictes polygon when annotation larger than image (?)
-        labels[contour.name][rr, cc] = 1
+        loops[contour.name].append(np.stack([r, c], axis=1))
 
-    return labels, source_image
+    labels = dict()
+    for name, name_loops in loops.items():
+        labels[name] = empty_label.copy()
+        labels[name][fill_even_odd(name_loops, empty_label.shape)] = 1   # restricted to the image
+
+    return labels
+
+
+def contour_holes(contours):
+    """
+    Find the contours that are holes, i.e. that are within an odd number of other contours of the same name.
+    :param contours: list of contours (named tuples with attributes name and points)
+    :return: boolean array, True for contours that are holes
+    """
+    holes = np.zeros(len(contours), dtype=bool)
+    indices = defaultdict(list)
+    for index, contour in enumerate(contours):
+        indices[contour.name].append(index)
+    for name, name_indices in indices.items():
+        depths, _ = polygon_hierarchy([contours[index].points for index in name_indices])
+        holes[name_indices] = depths % 2 == 1
+    return holes
 
 
 def bbox(points, type=int):
@@ -380,7 +474,8 @@ def bbox(points, type=int):
     return min(points[:, 1]), min(points[:, 0]), max(points[:, 1]), max(points[:, 0])
 
 
-def labels_to_contours(label_dict, pixel_size, border_colors=None, fill_colors=None, fill_modes=None, tolerance=5, level=0):
+def labels_to_contours(label_dict, pixel_size, border_colors=None, fill_colors=None, fill_modes=None, tolerance=5, level=0,
+                       smoothing=None, smoothing_iterations=1, smoothing_sigma=1.0, tracing="marching_squares"):
     """
     Converts a dictionary of label images into list of contours.
     :param label_dict: dictionary with label images indexed by label name
@@ -388,41 +483,69 @@ def labels_to_contours(label_dict, pixel_size, border_colors=None, fill_colors=N
     :param border_colors: dictionary of border colors indexed by label name, if None use [1, 0, 1]
     :param fill_colors: dictionary of fill colors indexed by label name, if None use [1, 0, 1]
     :param fill_modes: dictionary of fill modes indexed by label name, if None use fill pattern 9
-    :param tolerance: resolution for the contour polygon (see skimage.measure.approximate_polygon)
-    :return: list of contours (contour attributes and list of points with coordinates of micrometers)
+    :param tolerance: resolution for the contour polygon (see polygons.approximate_polygons)
+    :param level: value of the contour, labels are image values above level
+    :param smoothing: smoothing applied to all contours after simplification, e.g. "chaikin" (see smooth_loops)
+    :param smoothing_iterations: number of times the smoothing is applied
+    :param smoothing_sigma: standard deviation of the smoothing "gaussian" in pixels
+    :param tracing: method to trace the label boundaries, "marching_squares", "border_following" or "opencv"
+           (see trace_contours)
+    :return: list of contours (contour attributes and list of points with coordinates of micrometers),
+             contours of holes have the comment "hole" (see contour_holes)
     """
-    contours = []
+    names, loops, nested_names = [], [], set()
     for label_name, image_label in label_dict.items():
 
-        # invert imgae y axis, then transpose because contour coordinates exported as (y, x) not (x, y)
-        image_label = np.flipud(image_label).T
-        image_label = np.lib.pad(image_label, ((1, 1), (1, 1)), 'constant',  constant_values=((0,0),(0,0)))
-
-        for contour_in_label_image in find_contours(image_label, level):
-            # get coordinates of contour points and convert to micrometer units
-            points = approximate_polygon(contour_in_label_image, tolerance=tolerance) * pixel_size
-
-            # get border color, fill color and fill mode for each label from dictionary or use default
-            border_color = border_colors[label_name] if border_colors else [1, 0, 1]
-            fill_color = fill_colors[label_name] if fill_colors else [1, 0, 1]
-            fill_mode = fill_modes[label_name] if fill_modes else 9
-
-            if len(points) > 2:  # add contour if it has at least 3 points, to make an triangle
-                contours.append(ContourAttrib(
-                    label_name,
-                    False,  # hidden
-                    True,  # closed
-                    False,  # simplified
-                    border_color,
-                    fill_color,
-                    fill_mode,
-                    None,  # comment
-                    points))  # points
+        # contour coordinates (x, y) in pixels with inverted image y axis, holes are oriented clockwise
+        label_loops, label_holes = trace_contours(image_label, level, method=tracing)
+        if np.any(label_holes):
+            nested_names.add(label_name)   # without holes no contour is within another one
+
+        # simplify all closed contours together (see skimage.measure.approximate_polygon)
+        loops += approximate_polygons([np.vstack([loop, loop[:1]]) for loop in label_loops], tolerance)
+        names += [label_name] * len(label_loops)
 
+    if smoothing:   # in pixels, the repeated first point is dropped
+        loops = smooth_loops(loops, method=smoothing, iterations=smoothing_iterations, sigma=smoothing_sigma)
+
+    contours = []
+    for label_name, contour_in_label_image in zip(names, loops):
+        # add contour if it has at least 3 points (besides a repeated first point), to make an triangle
+        closing = len(contour_in_label_image) > 1 and np.array_equal(contour_in_label_image[0],
+                                                                      contour_in_label_image[-1])
+        if len(contour_in_label_image) - closing < 3:
+            continue
+
+        # get coordinates of contour points and convert to micrometer units
+        points = contour_in_label_image * pixel_size
+
+        # get border color, fill color and fill mode for each label from dictionary or use default
+        border_color = border_colors[label_name] if border_colors else [1, 0, 1]
+        fill_color = fill_colors[label_name] if fill_colors else [1, 0, 1]
+        fill_mode = fill_modes[label_name] if fill_modes else 9
+
+        contours.append(ContourAttrib(
+            label_name,
+            False,  # hidden
+            True,  # closed
+            False,  # simplified
+            border_color,
+            fill_color,
+            fill_mode,
+            None,  # comment, set for holes below
+            points))  # points
+
+    # holes by containment of the exported contours, as they are filled by contours_to_label_dict (the orientation of
+    # the traced holes may be lost by simplification, and contours of less than 3 points are dropped)
+    nested = [index for index, contour in enumerate(contours) if contour.name in nested_names]
+    for index, is_hole in zip(nested, contour_holes([contours[index] for index in nested])):
+        if is_hole:
+            contours[index] = contours[index]._replace(comment="hole")
     return contours
 
 
-def label_dict_to_xml_str(label_dict, image_shape, image_filename, pixel_size, section_thickness, section_index, **kwargs):
+def label_dict_to_xml_str(label_dict, image_shape, image_filename, pixel_size, section_thickness, section_index,
+                          proxy_filename=None, proxy_scale=None, significant_digits=None, **kwargs):
     """
     Converts a dictionary of label images into list of contours.
     Note: There is no support for transformation.
@@ -432,8 +555,11 @@ def label_dict_to_xml_str(label_dict, image_shape, image_filename, pixel_size, s
     :param pixel_size: width of an pixel of the label images in micrometer
     :param section_thickness: thickness of the section in micrometer
     :param section_index: index of the section in the image stack
-    :param kwargs: Additional parameters including label_dict, border_colors, fill_colors, fill_modes, resolution
-           (for explanation see labels_to_contours)
+    :param proxy_filename: file name of a downscaled proxy of the annotated image (relative to the xml), if any
+    :param proxy_scale: scale of the proxy image relative to the annotated image
+    :param significant_digits: number of significant digits of the coordinates, None for full precision
+    :param kwargs: Additional parameters including label_dict, border_colors, fill_colors, fill_modes, resolution,
+           smoothing, smoothing_iterations, tracing (for explanation see labels_to_contours)
     :return: string containing the xml
     """
 
@@ -452,8 +578,8 @@ def label_dict_to_xml_str(label_dict, image_shape, image_filename, pixel_size, s
         True,            # green
         True,            # blue
         image_filename,  # src
-        None,            # proxy_src
-        None)            # proxy_scale
+        proxy_filename,  # proxy_src
+        proxy_scale)     # proxy_scale
 
     # Describe image contour
     h, w = image_shape
@@ -473,7 +599,8 @@ def label_dict_to_xml_str(label_dict, image_shape, image_filename, pixel_size, s
     contours = labels_to_contours(label_dict, pixel_size, **kwargs)
 
     # Assemble xml
-    d = make_section_dict(section=section, image=image, image_contour=image_contour, contours=contours)
+    d = make_section_dict(section=section, image=image, image_contour=image_contour, contours=contours,
+                          significant_digits=significant_digits)
     e = dict_to_xml_str(d)
     e = prettify(e)
 
@@ -0,0 +1,176 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+try:  # python 2
+    from annotation import labels_to_contours, make_section_dict, dict_to_xml_str, prettify, read_section
+    from annotation import attributes_to_dict, contours_to_label_dict, SectionAttrib, ImageAttrib, ContourAttrib
+    from tracing import TRACING_METHODS, opencv_available
+except:  # python 3
+    from .annotation import labels_to_contours, make_section_dict, dict_to_xml_str, prettify, read_section
+    from .annotation import attributes_to_dict, contours_to_label_dict, SectionAttrib, ImageAttrib, ContourAttrib
+    from .tracing import TRACING_METHODS, opencv_available
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--benchmark", required=True, choices=["tracing", "startup", "serialization"])
+parser.add_argument("--size", type=int, default=2048, help="width and height of the synthetic label image")
+parser.add_argument("--repeat", type=int, default=3, help="number of repetitions, the fastest is reported")
+# tracing and serialization
+parser.add_argument("--tolerance", type=int, default=1, help="resolution for the contours in pixels")
+# serialization
+parser.add_argument("--pixel_size", type=float, default=0.005, help="width of pixel in micrometer")
+parser.add_argument("--smoothing", default=None, choices=["bspline", "chaikin", "gaussian"], help="smoothing of the contours")
+
+
+def make_label_image(size, seed=0):
+    """
+    Make a synthetic label image with blobs of different size, some of them with holes.
+    """
+    from scipy.ndimage import gaussian_filter
+    noise = np.random.RandomState(seed).rand(size, size)
+    return gaussian_filter(noise, sigma=size / 200.0) > 0.5 + 0.1 / (size / 200.0)
+
+
+def image_attributes(shape, pixel_size, image_filename="1.png"):
+    """
+    Image and its domain contour for a section with an image of the given shape, as label_dict_to_xml_str makes them.
+    """
+    h, w = shape
+    image = ImageAttrib(pixel_size, 1, 0, True, True, True, image_filename, None, None)
+    image_contour = ContourAttrib("domain1", False, True, False, [1, 0, 1], [1, 0, 1], 11, None,
+                                  np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]]))
+    return image, image_contour
+
+
+def rasterize(contours, shape, pixel_size=1.0):
+    """
+    Convert contours named 'label' back into a label image, as xml_to_label_dict does.
+    """
+    image, image_contour = image_attributes(shape, pixel_size)
+    labels = contours_to_label_dict(contours, image, image_contour)
+    return labels['label'] > 0 if 'label' in labels else np.zeros(shape, dtype=bool)
+
+
+def timed(function, repeat):
+    """
+    Call function repeatedly, return the shortest time in seconds and the result.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        result = function()
+        times.append(time.time() - start)
+    return min(times), result
+
+
+def benchmark_tracing(a):
+    """
+    Compare the tracing methods for labels_to_contours on a synthetic label image.
+    """
+    image = make_label_image(a.size)
+    print("label image %dx%d, %d foreground pixels, tolerance %d" % (a.size, a.size, image.sum(), a.tolerance))
+    for method in TRACING_METHODS:
+        if method == "opencv" and not opencv_available():
+            print("%-18s skipped (OpenCV not installed)" % method)
+            continue
+        seconds, contours = timed(lambda: labels_to_contours({'label': image}, 1.0, tolerance=a.tolerance,
+                                                             level=0.5, tracing=method), a.repeat)
+        points = sum(len(contour.points) for contour in contours)
+        mismatch = np.sum(rasterize(contours, image.shape) != image)
+        print("%-18s %8.3f s  %6d contours  %8d points  %8d pixels differ after rasterization"
+              % (method, seconds, len(contours), points, mismatch))
+
+
+def run_python(arguments, repeat):
+    """
+    Run python in a new process, return the shortest wall clock time in seconds.
+    """
+    with open(os.devnull, 'w') as devnull:
+        seconds, _ = timed(lambda: subprocess.check_call([sys.executable] + arguments, stdout=devnull, stderr=devnull),
+                           repeat)
+    return seconds
+
+
+def benchmark_startup(a):
+    """
+    Measure the time to start python, import the modules and run each operation of process.py on a single small file.
+    """
+    from skimage.io import imsave
+    tools_dir = os.path.dirname(os.path.abspath(__file__))
+    process_py = os.path.join(tools_dir, "process.py")
+    temp_dir = tempfile.mkdtemp()
+    try:
+        # a small dataset with one image and one label, and the example section
+        for sub_dir in ["images", "labels", "sections"]:
+            os.makedirs(os.path.join(temp_dir, sub_dir))
+        image = make_label_image(256)
+        imsave(os.path.join(temp_dir, "images", "1.png"), (image * 255).astype(np.uint8), check_contrast=False)
+        imsave(os.path.join(temp_dir, "labels", "1.png"), (image * 255).astype(np.uint8), check_contrast=False)
+        shutil.copy(os.path.join(tools_dir, "test", "xml_example", "newSeries.373.xml"),
+                    os.path.join(temp_dir, "sections", "series.373"))
+
+        jobs = [("python", ["-c", "pass"]),
+                ("import annotation", ["-c", "import sys; sys.path.insert(0, %r); import annotation" % tools_dir]),
+                ("process.py --help", [process_py, "--help"]),
+                ("features", [process_py, "--operation", "features", "--input_dir", os.path.join(temp_dir, "labels/")]),
+                ("contours", [process_py, "--operation", "contours", "--input_dir", os.path.join(temp_dir, "images/")]),
+                ("labels", [process_py, "--operation", "labels", "--input_dir", os.path.join(temp_dir, "sections/series")])]
+        for name, arguments in jobs:
+            if arguments[0] == process_py and len(arguments) > 2:
+                arguments = arguments + ["--output_dir", os.path.join(temp_dir, "output", name)]
+            print("%-18s %8.3f s" % (name, run_python(arguments, a.repeat)))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def benchmark_serialization(a):
+    """
+    Compare file size and serialization throughput of the section xml for different numbers of significant digits,
+    and the largest error of the coordinates read back from the xml.
+    """
+    image = make_label_image(a.size)
+    contours = labels_to_contours({'label': image}, a.pixel_size, tolerance=a.tolerance, level=0.5,
+                                  smoothing=a.smoothing)
+    points = np.concatenate([contour.points for contour in contours])
+    section = SectionAttrib(False, 1, 0.05)
+    image_attrib, image_contour = image_attributes(image.shape, a.pixel_size)
+    print("label image %dx%d, %d contours, %d points, pixel size %g, smoothing %s"
+          % (a.size, a.size, len(contours), len(points), a.pixel_size, a.smoothing))
+    for significant_digits in [None, 8, 6, 4]:
+        format_seconds, _ = timed(lambda: [attributes_to_dict(contour, significant_digits) for contour in contours],
+                                  a.repeat)
+        seconds, xml = timed(lambda: prettify(dict_to_xml_str(make_section_dict(
+            section, image_attrib, image_contour, contours=contours, significant_digits=significant_digits))),
+            a.repeat)
+        size = len(xml.encode("utf-8"))
+        read_points = np.concatenate([contour.points for contour in read_section(io.BytesIO(xml.encode("utf-8")))[4]])
+        error = np.abs(read_points - points).max() / a.pixel_size
+        print("%-18s %8.3f s attributes (%5.2f Mpoints/s) %8.3f s xml (%5.1f MB/s) %8d bytes  %.2g pixels max error"
+              % ("full precision" if significant_digits is None else "%d digits" % significant_digits,
+                 format_seconds, len(points) / format_seconds / 1e6, seconds, size / seconds / 1e6, size, error))
+
+
+def main():
+    a = parser.parse_args()
+    if a.benchmark == "tracing":
+        benchmark_tracing(a)
+    elif a.benchmark == "startup":
+        benchmark_startup(a)
+    elif a.benchmark == "serialization":
+        benchmark_serialization(a)
+
+
+if __name__ == "__main__":
+    main()
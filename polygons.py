@@ -0,0 +1,206 @@
+"""
+Geometry of many polygons at once: orientation, containment, simplification and even-odd rasterization.
+
+Polygons are given as a list of arrays of points, which are concatenated with offsets (see
+smoothing.concatenate_contours), so each function works on all edges of all polygons together.
+"""
+
+import numpy as np
+
+try:  # python 2
+    from smoothing import concatenate_contours, cyclic_neighbours
+except:  # python 3
+    from .smoothing import concatenate_contours, cyclic_neighbours
+
+
+def polygon_edges(loops):
+    """
+    Return the edges of closed polygons as start and end points, and the offsets of the polygons.
+    """
+    points, offsets = concatenate_contours(loops)
+    following = points[cyclic_neighbours(offsets, [1])[:, 0]] if len(points) else points
+    return points, following, offsets
+
+
+def signed_areas(loops):
+    """
+    Signed area of each polygon (shoelace formula), positive for counterclockwise polygons.
+    """
+    points, following, offsets = polygon_edges(loops)
+    if len(points) == 0:
+        return np.zeros(len(loops))
+    cross = points[:, 0] * following[:, 1] - following[:, 0] * points[:, 1]
+    sums = np.add.reduceat(cross, np.minimum(offsets[:-1], len(cross) - 1))
+    return 0.5 * np.where(np.diff(offsets) > 0, sums, 0)
+
+
+def points_in_polygons(query, loops, block_size=10 ** 7):
+    """
+    Test which points are inside which polygons (crossing number).
+    :param query: array of points with shape (n, 2)
+    :param loops: list of polygons
+    :param block_size: maximal number of point-edge pairs that are tested at once
+    :return: boolean array of shape (n, len(loops)), True if the point is inside the polygon
+    """
+    query = np.asarray(query, dtype=float).reshape(-1, 2)
+    points, following, offsets = polygon_edges(loops)
+    inside = np.zeros((len(query), len(loops)), dtype=bool)
+    if len(points) == 0:
+        return inside
+    x0, y0 = points[:, 0], points[:, 1]
+    x1, y1 = following[:, 0], following[:, 1]
+    not_empty = np.diff(offsets) > 0
+    step = max(block_size // len(points), 1)
+    for start in range(0, len(query), step):
+        qx = query[start:start + step, 0][:, None]
+        qy = query[start:start + step, 1][:, None]
+        crossing = (y0 > qy) != (y1 > qy)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crossing &= qx < x0 + (qy - y0) * (x1 - x0) / (y1 - y0)
+        counts = np.add.reduceat(crossing.astype(int), np.minimum(offsets[:-1], len(points) - 1), axis=1)
+        inside[start:start + step] = (counts % 2 == 1) & not_empty
+    return inside
+
+
+def polygon_hierarchy(loops):
+    """
+    Find the nesting of polygons by containment, e.g. holes within objects and islands within holes.
+    Note: Polygons must not intersect each other. Each polygon is represented by the midpoint of its first edge, which
+          is only tested against the edges of the polygons whose bounding box contains it. These pairs are found by a
+          KD-tree over the midpoints, so the time grows with the number of pairs, not with the square of the number of
+          polygons.
+    :param loops: list of polygons
+    :return: depths: number of polygons containing each polygon, odd depths are holes
+             parents: index of the innermost polygon containing each polygon, -1 for outermost polygons
+    """
+    from scipy.spatial import cKDTree
+    number = len(loops)
+    depths, parents = np.zeros(number, dtype=int), -np.ones(number, dtype=int)
+    points, following, offsets = polygon_edges(loops)
+    lengths = np.diff(offsets)
+    if len(points) == 0:
+        return depths, parents
+    valid = np.flatnonzero(lengths > 0)
+    starts = offsets[valid]
+    midpoints = 0.5 * (points[starts] + following[starts])
+    lower, upper = np.minimum.reduceat(points, starts), np.maximum.reduceat(points, starts)
+
+    # pairs of a midpoint and a polygon whose bounding box contains it, from the square around the bounding box
+    neighbours = cKDTree(midpoints).query_ball_point(0.5 * (lower + upper), 0.5 * np.max(upper - lower, axis=1),
+                                                     p=np.inf)
+    candidates = np.repeat(np.arange(len(valid)), [len(indices) for indices in neighbours])
+    queries = np.concatenate([np.asarray(indices, dtype=int) for indices in neighbours])
+    in_box = np.all((midpoints[queries] >= lower[candidates]) & (midpoints[queries] <= upper[candidates]), axis=1)
+    in_box &= queries != candidates
+    queries, candidates = queries[in_box], candidates[in_box]
+    if len(queries) == 0:
+        return depths, parents
+
+    # crossing number of each pair over the edges of the polygon
+    counts = lengths[valid[candidates]]
+    pairs = np.repeat(np.arange(len(queries)), counts)
+    edges = np.repeat(starts[candidates], counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                                                            counts)
+    qx, qy = midpoints[queries[pairs], 0], midpoints[queries[pairs], 1]
+    x0, y0, x1, y1 = points[edges, 0], points[edges, 1], following[edges, 0], following[edges, 1]
+    crossing = (y0 > qy) != (y1 > qy)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing &= qx < x0 + (qy - y0) * (x1 - x0) / (y1 - y0)
+    inside = np.add.reduceat(crossing.astype(int), np.cumsum(counts) - counts) % 2 == 1
+    queries, candidates = valid[queries[inside]], valid[candidates[inside]]
+
+    # the innermost container is the one with the largest depth
+    depths = np.bincount(queries, minlength=number)
+    order = np.lexsort((depths[candidates], queries))
+    last = np.concatenate([queries[order][1:] != queries[order][:-1], [True]])
+    parents[queries[order][last]] = candidates[order][last]
+    return depths, parents
+
+
+def fill_even_odd(loops, shape):
+    """
+    Rasterize polygons with the even-odd rule in a single scanline pass: pixels are inside if their center is
+    enclosed by an odd number of polygons, therefore holes and islands need no special treatment.
+    :param loops: list of polygons with points (row, column) in pixels
+    :param shape: shape of the image
+    :return: boolean image
+    """
+    height, width = shape
+    points, following, offsets = polygon_edges(loops)
+    if len(points) == 0:
+        return np.zeros(shape, dtype=bool)
+    r0, c0 = points[:, 0], points[:, 1]
+    r1, c1 = following[:, 0], following[:, 1]
+
+    # each edge crosses the rows of pixel centers within [min(r0, r1), max(r0, r1))
+    first = np.clip(np.ceil(np.minimum(r0, r1)), 0, height).astype(int)
+    stop = np.clip(np.ceil(np.maximum(r0, r1)), 0, height).astype(int)
+    counts = np.maximum(stop - first, 0)
+    edges = np.repeat(np.arange(len(r0)), counts)
+    rows = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    columns = c0[edges] + (rows - r0[edges]) * (c1[edges] - c0[edges]) / (r1[edges] - r0[edges])
+
+    # crossings sorted along each row come in pairs, fill the pixel centers in [start, stop)
+    order = np.lexsort((columns, rows))
+    rows, columns = rows[order], columns[order]
+    starts = np.clip(np.ceil(columns[0::2]), 0, width).astype(int)
+    stops = np.clip(np.ceil(columns[1::2]), 0, width).astype(int)
+    changes = np.zeros((height, width + 1), dtype=int)
+    np.add.at(changes, (rows[0::2], starts), 1)
+    np.add.at(changes, (rows[0::2], stops), -1)
+    return np.cumsum(changes, axis=1)[:, :-1] > 0
+
+
+def approximate_polygons(loops, tolerance):
+    """
+    Approximate polygonal chains with the Douglas-Peucker algorithm (as skimage.measure.approximate_polygon), all
+    chains are processed together: in each iteration all pending segments of all chains are split at once.
+    Note: For closed polygons the first point must be repeated at the end.
+    :param loops: list of polygonal chains, arrays of points with shape (n, 2)
+    :param tolerance: maximum distance of the original points to the approximated chain, 0 returns the chains
+    :return: list of approximated chains
+    """
+    if tolerance <= 0:
+        return list(loops)
+    lengths = np.array([len(loop) for loop in loops], dtype=int)
+    if lengths.sum() == 0:
+        return list(loops)
+    coords = np.concatenate([np.asarray(loop, dtype=float).reshape(-1, 2) for loop in loops])
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+    chain = np.zeros(len(coords), dtype=bool)
+    chain[offsets[:-1][lengths > 0]] = True
+    chain[offsets[1:][lengths > 0] - 1] = True
+    starts, ends = offsets[:-1][lengths > 2], offsets[1:][lengths > 2] - 1
+
+    while len(starts):
+        # interior points of all segments
+        counts = ends - starts - 1
+        segments = np.repeat(np.arange(len(starts)), counts)
+        points = np.repeat(starts + 1, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        r0, c0 = coords[starts[segments], 0], coords[starts[segments], 1]
+        r1, c1 = coords[ends[segments], 0], coords[ends[segments], 1]
+        r, c = coords[points, 0], coords[points, 1]
+
+        # perpendicular distance to the segment, or distance to the closest end point outside of the segment
+        dr, dc = r1 - r0, c1 - c0
+        angle = -np.arctan2(dr, dc)
+        perpendicular = np.abs(r * np.cos(angle) + c * np.sin(angle) - (c0 * np.sin(angle) + r0 * np.cos(angle)))
+        inner = ((r - r0) * dr + (c - c0) * dc > 0) & (-(r - r1) * dr - (c - c1) * dc > 0)
+        distances = np.where(inner, perpendicular, np.minimum(np.hypot(c - c0, r - r0), np.hypot(c - c1, r - r1)))
+
+        # split segments at the first point with the maximal distance, if it exceeds the tolerance
+        maxima = np.maximum.reduceat(distances, np.cumsum(counts) - counts)
+        candidates = np.flatnonzero(distances == maxima[segments])
+        split_segments, first = np.unique(segments[candidates], return_index=True)
+        splits = points[candidates[first]]
+        selected = maxima[split_segments] > tolerance
+        split_segments, splits = split_segments[selected], splits[selected]
+        chain[splits] = True
+
+        starts = np.concatenate([starts[split_segments], splits])
+        ends = np.concatenate([splits, ends[split_segments]])
+        keep = ends - starts > 1
+        starts, ends = starts[keep], ends[keep]
+
+    return [coords[start:stop][chain[start:stop]] for start, stop in zip(offsets[:-1], offsets[1:])]
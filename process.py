@@ -2,8 +2,9 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import pandas as pd
 import argparse
+import io
+import itertools
 import os
 import threading
 import time
@@ -11,24 +12,37 @@ import glob
 import warnings
 import shutil
 
-from skimage.segmentation import clear_border
-from skimage.measure import label, regionprops
-from skimage.morphology import closing, square
-from skimage.io import imread, imsave
-
-import multiprocessing
+# Note: Modules that take long to import (pandas, skimage, multiprocessing) are imported by the operations
+#       that need them, so short jobs and newly started workers do not wait for unused imports.
 
 try:  # python 2
-    from annotation import xml_to_label_dict, label_dict_to_xml_str
+    from annotation import xml_to_label_dict, label_dict_to_xml_str, read_section
+    from section_diff import diff_sections, changed_label_dict, changes_report
+    from proxy import write_proxies
+    from workqueue import parse_shard, shard, shard_selector, WorkQueue, QUEUE_DIR
+    from registration import register_series, REGISTRATION_COLUMNS, TRANSFORM_DIMS
+    from section_io import split_compression, split_archive, find_section, is_archive, is_section, iter_archive, write_section, ArchiveWriter, ARCHIVES
 except:  # python 3
-    from .annotation import xml_to_label_dict, label_dict_to_xml_str
+    from .annotation import xml_to_label_dict, label_dict_to_xml_str, read_section
+    from .section_diff import diff_sections, changed_label_dict, changes_report
+    from .proxy import write_proxies
+    from .workqueue import parse_shard, shard, shard_selector, WorkQueue, QUEUE_DIR
+    from .registration import register_series, REGISTRATION_COLUMNS, TRANSFORM_DIMS
+    from .section_io import split_compression, split_archive, find_section, is_archive, is_section, iter_archive, write_section, ArchiveWriter, ARCHIVES
 
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--input_dir", required=True, help="path to folder containing images")
 parser.add_argument("--output_dir", required=True, help="output path")
-parser.add_argument("--operation", required=True, choices=["features", "contours", "labels"])
+parser.add_argument("--operation", required=True, choices=["features", "contours", "labels", "changes", "register"])
 parser.add_argument("--workers", type=int, default=1, help="number of workers")
+# compressed sections (archives of sections in the input_dir are read member by member)
+parser.add_argument("--compression", default=None, choices=["gz", "zst"], help="compress the xml files written by the operation contours")
+parser.add_argument("--archive", default=None, help="write the xml files of the operation contours into this archive in the output_dir, e.g. series.tar.gz or series.zip (with --shard i/N series.iofN.tar.gz)")
+# distributed execution
+parser.add_argument("--shard", default=None, help="process only the i-th of N parts of the files, given as i/N (starting with 0)")
+parser.add_argument("--queue", action="store_true", help="claim files with lock files in the output_dir, so several invocations can share the work")
+parser.add_argument("--stale_timeout", type=float, default=3600, help="seconds after which claims of other invocations are considered stale")
 # features
 parser.add_argument("--min_area", default=10, help="minimal area (in pixels) for a region to be considered for feature extraction")
 # contours
@@ -36,6 +50,19 @@ parser.add_argument("--pixel_size", default=0.050, help="width of pixel in micro
 parser.add_argument("--section_thickness", default=0.030, help="thickness of section in micrometer")
 parser.add_argument("--tolerance", type=int, default=5, help="resolution for the contours in pixels")
 parser.add_argument("--level", type=int, default=254, help="value for the label (True=255)")
+parser.add_argument("--tracing", default="marching_squares", choices=["marching_squares", "border_following", "opencv"], help="method to trace the boundaries of the labels")
+parser.add_argument("--smoothing", default=None, choices=["bspline", "chaikin", "gaussian"], help="smoothing of the contours after simplification")
+parser.add_argument("--smoothing_iterations", type=int, default=1, help="number of times the smoothing is applied")
+parser.add_argument("--smoothing_sigma", type=float, default=1.0, help="standard deviation of the smoothing gaussian along the contour in pixels")
+parser.add_argument("--significant_digits", type=int, default=6, help="significant digits of the coordinates in the xml files (0=full precision)")
+parser.add_argument("--proxy_levels", type=int, default=0, help="number of levels of downscaled proxy images (0=no proxies)")
+# register
+parser.add_argument("--dim", type=int, default=3, choices=TRANSFORM_DIMS, help="number of terms of the transform (1=translation, 3=affine, 6=quadratic)")
+parser.add_argument("--ratio", type=float, default=0.8, help="maximal ratio of the distances to the nearest and second nearest region for a match")
+parser.add_argument("--max_distance", type=float, default=float("inf"), help="maximal distance of matched regions in micrometer")
+parser.add_argument("--image_height", type=int, default=None, help="height of the images in pixels, to invert the y axis as Reconstruct")
+# changes
+parser.add_argument("--previous_dir", help="path to folder containing the previous version of the xml files")
 
 a = parser.parse_args()
 
@@ -46,6 +73,10 @@ def features(src):
     :param src: source image
     :return: dataframe containing the features
     """
+    import pandas as pd
+    from skimage.segmentation import clear_border
+    from skimage.measure import label, regionprops
+    from skimage.morphology import closing, square
 
     # apply threshold
     bw = closing(src > 0, square(3))
@@ -79,11 +110,18 @@ def features(src):
     return dst
 
 
-def process(src_path):
+def process(src_path, data=None):
+    """
+    Process a file.
+    :param src_path: path of the file
+    :param data: content of the file, if it is a member of an archive (src_path is the path it would be extracted to)
+    :return: name and content of the xml file, if it is written to an archive
+    """
     if a.operation == "features":
         """
         Extract features for registration to and save dataframe as csv file.
         """
+        from skimage.io import imread
         name, _ = os.path.splitext(os.path.basename(src_path))
         dst_path = os.path.join(a.output_dir, name + ".csv")
         src = imread(src_path)
@@ -95,21 +133,49 @@ def process(src_path):
         Convert contours (xml files) saved by Reconstruct/Win 1.1.0.1. into labels (png files).
         Note: The xml files for Reconstruct/Win 1.1.0.1 have no .xml extension,
               but  ".ser" or a dot and a digit representing the section index
+              The xml files may be compressed (.gz, .zst) or members of an archive
         """
-        name, ext = os.path.splitext(os.path.basename(src_path))
+        name, ext = os.path.splitext(split_compression(os.path.basename(src_path))[0])
         if ext != ".ser":
             dst_basename = ext[1:]    # get rid of the leading dot
-            labels, source_image = xml_to_label_dict(src_path)
+            xml_file = io.BytesIO(data) if data is not None else src_path
+            labels, source_image = xml_to_label_dict(xml_file, image_dir=os.path.dirname(src_path))
             if source_image is not None:
                 save_image_to_sub_dir(source_image, a.output_dir, 'image', dst_basename)
-            for label_name, label_image in labels.iteritems():
-                save_image_to_sub_dir(label_image, a.output_dir, label_name, dst_basename)
+            for label_name, label_image in labels.items():
+                save_image_to_sub_dir(label_to_uint8(label_image), a.output_dir, label_name, dst_basename)
+
+    elif a.operation == "changes":
+        """
+        Compare contours (xml files) with their previous version and update the labels (png files) of changed objects.
+        The changes are reported as csv file for each section.
+        """
+        import pandas as pd
+        basename = split_compression(os.path.basename(src_path))[0]
+        name, ext = os.path.splitext(basename)
+        if ext != ".ser":
+            dst_basename = ext[1:]    # get rid of the leading dot
+            section = read_section(io.BytesIO(data) if data is not None else src_path)   # read once
+            previous_path = find_section(os.path.join(a.previous_dir, basename))   # None if all objects are new
+            changes = diff_sections(previous_path, section)
+            for label_name, label_image in changed_label_dict(section, changes).items():
+                save_image_to_sub_dir(label_to_uint8(label_image), a.output_dir, label_name, dst_basename)
+            for label_name in changes["removed"]:
+                label_filename = os.path.join(a.output_dir, label_name, dst_basename + ".png")
+                if os.path.exists(label_filename):
+                    os.remove(label_filename)
+            report = pd.DataFrame(changes_report(changes), columns=['name', 'change'])
+            report_dir = os.path.join(a.output_dir, 'changes')
+            if not os.path.exists(report_dir):
+                os.makedirs(report_dir)
+            report.to_csv(os.path.join(report_dir, dst_basename + ".csv"))
 
     elif a.operation == "contours":
         """
         Convert labels (png files) to contours (xml files) that can be read by Reconstruct/Win 1.1.0.1.
         Note: The xml files for Reconstruct/Win 1.1.0.1 have no .xml extension
         """
+        from skimage.io import imread
         image_filename = os.path.basename(src_path)
         name, _ = os.path.splitext(image_filename)
         if name.isdigit():   # filename of the image is a number string
@@ -122,7 +188,7 @@ def process(src_path):
 
             # get label images from label directories and use directory name as label name
             label_dict = dict()
-            for label_name, label_dir in label_dirs.iteritems():
+            for label_name, label_dir in label_dirs.items():
                 label_filename = os.path.join(label_dir, name + ".png")
                 if os.path.exists(label_filename):
                     label_image = imread(label_filename)
@@ -130,6 +196,13 @@ def process(src_path):
                 # else:
                 #     print ("No label %s for section %d" % (label_name, section_index))
 
+            # proxy images (already generated proxies are reused if the image did not change)
+            proxy_filename, proxy_scale = None, None
+            if a.proxy_levels > 0:
+                import multiprocessing
+                threads = max(multiprocessing.cpu_count() // a.workers, 1)
+                proxy_filename, proxy_scale = write_proxies(src_path, a.output_dir, a.proxy_levels, threads)
+
             # xml file with contours
             e = label_dict_to_xml_str(
                 label_dict=label_dict,
@@ -138,18 +211,36 @@ def process(src_path):
                 pixel_size=float(a.pixel_size),
                 section_thickness=float(a.section_thickness),
                 section_index=int(name),
+                proxy_filename=proxy_filename,
+                proxy_scale=proxy_scale,
+                significant_digits=a.significant_digits or None,
                 tolerance=int(a.tolerance),
-                level=int(a.level))
+                level=int(a.level),
+                tracing=a.tracing,
+                smoothing=a.smoothing,
+                smoothing_iterations=a.smoothing_iterations,
+                smoothing_sigma=a.smoothing_sigma)
             # xml_filename = os.path.join(a.output_dir, 'series'+name+".xml")
             xml_filename = os.path.join(a.output_dir, 'series.'+name)   # no xml extension used !
-            with open(xml_filename, "w") as text_file:
-                text_file.write(e)
+            if a.archive:
+                return os.path.basename(xml_filename), e   # written to the archive by the main process
+            if a.compression:
+                xml_filename += "." + a.compression
+            write_section(xml_filename, e)
 
     else:
         raise Exception("invalid operation")
 
 
+def label_to_uint8(label_image):
+    """
+    Convert a label image with values 0 and 1 to an 8 bit image with values 0 and 255, which can be saved as png.
+    """
+    return (label_image > 0).astype("uint8") * 255
+
+
 def save_image_to_sub_dir(image, base_dir, sub_dir, basename, ext=".png"):
+    from skimage.io import imsave
     full_dir = os.path.join(base_dir, sub_dir)
     if not os.path.exists(full_dir):
         os.makedirs(full_dir)
@@ -159,6 +250,91 @@ def save_image_to_sub_dir(image, base_dir, sub_dir, basename, ext=".png"):
         imsave (full_path, image)
 
 
+def task_path(task):
+    """
+    Path of the file of a task, which is the path of a file or a tuple of path and content of an archive member.
+    """
+    return task[0] if isinstance(task, tuple) else task
+
+
+def process_task(task):
+    """
+    Process a task, which is the path of a file or a tuple of path and content of an archive member.
+    """
+    return process(*task) if isinstance(task, tuple) else process(task)
+
+
+def process_queued(task):
+    """
+    Process a task, if it can be claimed in the work queue, and mark it as finished. The claim is renewed while the
+    task is processed.
+    :return: claimed: False if the task was skipped, because it is done or claimed by another invocation
+             result: result of process_task
+    """
+    src_path = task_path(task)
+    queue = WorkQueue(os.path.join(a.output_dir, QUEUE_DIR), a.stale_timeout)
+    if not queue.claim(src_path):
+        return False, None
+    start_time = time.time()
+    try:
+        with queue.heartbeat(src_path):
+            result = process_task(task)
+    except Exception as e:
+        queue.complete(src_path, "failed", time.time() - start_time, repr(e))
+        print("failed %s: %r" % (src_path, e))
+        return True, None
+    queue.complete(src_path, "done", time.time() - start_time)
+    return True, result
+
+
+def expand_archives(src_paths, select=None):
+    """
+    Replace archives of sections by their members, which are read one at a time. Only the sections of the series
+    named as the archive are read, e.g. series.12 from series.tar.gz, other members such as images are skipped.
+    :param select: function called with each file and section in an archive in turn, True if it is processed (see
+                   workqueue.shard_selector), None for all
+    :return: generator of paths of files and tuples of path and content of archive members
+    """
+    global total
+    for src_path in src_paths:
+        if is_archive(src_path):
+            prefix = split_archive(os.path.basename(src_path))[0]
+            selected = lambda name: is_section(name, prefix) and (select is None or select(name))
+            for name, data in iter_archive(src_path, selected):
+                total += 1
+                yield os.path.join(os.path.dirname(src_path), name), data
+        elif select is None or select(src_path):
+            yield src_path
+
+
+def recorded(tasks, paths):
+    """
+    Pass on the tasks and append their paths to the list paths.
+    """
+    for task in tasks:
+        paths.append(task_path(task))
+        yield task
+
+
+def bounded(tasks, pending):
+    """
+    Pass on the tasks, each after acquiring the semaphore pending, which is released when a task is finished. So only
+    a limited number of archive members is read in advance, while the workers are kept busy.
+    """
+    for task in tasks:
+        pending.acquire()
+        yield task
+
+
+def init_worker(worker_label_dirs):
+    """
+    Pass the label directories to workers, which do not inherit globals when started by spawn.
+    """
+    global label_dirs
+    label_dirs = worker_label_dirs
+
+
+label_dirs = dict()
 complete_lock = threading.Lock()
 start = None
 num_complete = 0
@@ -172,7 +348,7 @@ def complete():
     elapsed = now - start
     rate = num_complete / elapsed
     if rate > 0:
-        remaining = (total - num_complete) / rate
+        remaining = max(total - num_complete, 0) / rate
     else:
         remaining = 0
 
@@ -185,9 +361,29 @@ def main():
     if not os.path.exists(a.output_dir):
         os.makedirs(a.output_dir)
 
+    if a.operation == 'changes' and a.previous_dir is None:
+        parser.error("--previous_dir is required for operation changes")
+
+    if a.archive and a.queue:
+        parser.error("--archive is not supported with --queue, the archive is written by a single invocation")
+
+    if a.archive and not is_archive(a.archive):
+        parser.error("--archive must end with one of %s" % ", ".join(ARCHIVES))
+
+    if a.operation == 'register' and (a.shard is not None or a.queue):
+        parser.error("--shard and --queue are not supported for operation register, which needs pairs of sections")
+
+    if a.significant_digits < 0:
+        parser.error("--significant_digits must be at least 0 (0=full precision), got %d" % a.significant_digits)
+
+    if a.shard is not None:
+        try:
+            shard_index, shard_count = parse_shard(a.shard)
+        except ValueError as e:
+            parser.error(str(e))
+
+    global label_dirs
     if a.operation == 'contours':
-        global label_dirs
-        label_dirs = dict()
         image_dir = os.path.dirname(a.input_dir)
         parent_dir = os.path.dirname(os.path.dirname(a.input_dir))
         for sub_dir in os.listdir(parent_dir):
@@ -206,21 +402,85 @@ def main():
     else:
         src_paths = glob.glob(a.input_dir+"*")
 
+    if a.operation == "register":
+        """
+        Register each section to the previous section by the regions in the feature files (csv files) and save the
+        coefficients of the transforms as csv file. The pairs of sections are processed by the workers in parallel.
+        """
+        import pandas as pd
+        print("registering %d sections" % len(src_paths))
+        records = register_series(src_paths, dim=a.dim, ratio=a.ratio, max_distance=a.max_distance,
+                                  pixel_size=float(a.pixel_size), image_height=a.image_height, workers=a.workers)
+        registration = pd.DataFrame(records, columns=REGISTRATION_COLUMNS)
+        for column in ['xcoef', 'ycoef']:   # as in the xml files
+            registration[column] = [" ".join(map(str, coef)) if coef is not None else "" for coef in registration[column]]
+        registration.to_csv(os.path.join(a.output_dir, "registration.csv"))
+        print("%d of %d sections registered" % (registration['rms'].notnull().sum(), len(records)))
+        return
+
+    # files before archives, in the same order for all invocations, so each shard takes every N-th file or member
+    src_paths = sorted(src_paths, key=lambda src_path: (is_archive(src_path), src_path))
+    archives = [src_path for src_path in src_paths if is_archive(src_path)]
+    if archives and a.operation not in ["labels", "changes"]:
+        parser.error("archives are only read by the operations labels and changes: %s" % ", ".join(archives))
+    select = shard_selector(shard_index, shard_count) if a.shard is not None else None
+
     global total
-    total = len(src_paths)
-    
-    print("processing %d files" % total)
+    total = len(src_paths) - len(archives)
+    if a.shard is not None:
+        total = len(shard(src_paths[:total], shard_index, shard_count))
+
+    print("processing %d files" % total + (" and the files in %d archives" % len(archives) if archives else ""))
 
     global start
     start = time.time()
 
+    # with a work queue, files claimed by other invocations are skipped
+    process_function = process_queued if a.queue else process_task
+
+    # files in archives are counted when they are read, the paths of all tasks are kept for the work queue
+    task_paths = []
+    tasks = expand_archives(src_paths, select)
+    if a.queue:
+        tasks = recorded(tasks, task_paths)
+    archive = None
+    if a.archive:
+        archive_name = a.archive
+        if a.shard is not None:   # an archive for each shard, e.g. series.0of4.tar.gz
+            base, ext = split_archive(a.archive)
+            archive_name = "%s.%dof%d%s" % (base, shard_index, shard_count, ext)
+        archive = ArchiveWriter(os.path.join(a.output_dir, archive_name))
+
+    pending = threading.Semaphore(a.workers * 16)   # tasks read in advance
+    tasks = bounded(tasks, pending)
     if a.workers == 1:
-        for args in src_paths:
-            process(args)
-            complete()
+        results = (process_function(task) for task in tasks)
     else:
-        pool = multiprocessing.Pool(a.workers)
-        for result in pool.imap_unordered(process, src_paths):
-            complete()
-
-main()
+        import multiprocessing
+        pool = multiprocessing.Pool(a.workers, initializer=init_worker, initargs=(label_dirs,))
+        results = pool.imap_unordered(process_function, tasks)
+    for result in results:
+        pending.release()
+        if a.queue:
+            claimed, result = result
+            if not claimed:   # processed by another invocation
+                continue
+        if result is not None and archive is not None:
+            archive.add(*result)
+        complete()
+    if archive is not None:
+        archive.close()
+
+    if a.queue:
+        # merged report of all invocations sharing the queue, written by the invocation that finishes last
+        queue = WorkQueue(os.path.join(a.output_dir, QUEUE_DIR), a.stale_timeout)
+        if queue.is_finished(task_paths):
+            records = queue.write_report(os.path.join(a.output_dir, "run_report.csv"))
+            failed = sum(record["status"] == "failed" for record in records)
+            print("%d files finished by all invocations, %d failed" % (len(records), failed))
+        else:
+            print("files are still processed by other invocations, the last one writes run_report.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Downscaled proxy images, which Reconstruct displays instead of the full resolution images (see Image proxy_src).
+
+Each level of the pyramid halves the width and height of the previous level by the mean of blocks of 2x2 pixels.
+"""
+
+import os
+import warnings
+
+import numpy as np
+
+PROXY_DIR = "proxy"
+
+
+def block_mean(image, factor=2):
+    """
+    Downscale an image by the mean of blocks of factor x factor pixels.
+    Note: Images with a size that is not a multiple of factor are padded by repeating the last row or column.
+    :param image: gray scale image (h, w) or color image (h, w, channels)
+    :param factor: width and height of the blocks
+    :return: image of shape (ceil(h / factor), ceil(w / factor), ...) of the same dtype
+    """
+    h, w = image.shape[:2]
+    padding = [(0, -h % factor), (0, -w % factor)] + [(0, 0)] * (image.ndim - 2)
+    padded = np.pad(image, padding, mode='edge')
+    blocks = padded.reshape((padded.shape[0] // factor, factor, padded.shape[1] // factor, factor) + image.shape[2:])
+    mean = blocks.mean(axis=(1, 3))
+    if np.issubdtype(image.dtype, np.integer):
+        mean = np.round(mean)
+    return mean.astype(image.dtype)
+
+
+def block_mean_parallel(image, factor=2, workers=1):
+    """
+    Downscale an image by block_mean, computed on strips of rows in parallel threads.
+    """
+    h = image.shape[0]
+    strip = max(-(-h // (workers * factor)) * factor, factor)   # multiple of factor
+    if workers <= 1 or h <= strip:
+        return block_mean(image, factor)
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(workers)
+    try:
+        strips = pool.map(lambda start: block_mean(image[start:start + strip], factor), range(0, h, strip))
+    finally:
+        pool.close()
+    return np.concatenate(strips)
+
+
+def make_pyramid(image, levels, workers=1):
+    """
+    Make a pyramid of downscaled images.
+    :param image: full resolution image
+    :param levels: number of levels, the k-th level is downscaled by 2**k
+    :param workers: number of threads for each level
+    :return: list of images, starting with the first downscaled level
+    """
+    pyramid = []
+    for _ in range(levels):
+        image = block_mean_parallel(image, 2, workers)
+        pyramid.append(image)
+    return pyramid
+
+
+def proxy_filename(image_filename, level):
+    """
+    Relative path of the proxy image of a level, e.g. proxy/1.2.png for level 2 of 1.png.
+    """
+    name, ext = os.path.splitext(os.path.basename(image_filename))
+    return os.path.join(PROXY_DIR, "%s.%d%s" % (name, level, ext))
+
+
+def write_proxies(src_path, output_dir, levels, workers=1):
+    """
+    Write a pyramid of proxy images, unless proxies at least as new as the source image exist.
+    :param src_path: path of the full resolution image
+    :param output_dir: directory of the series, proxies are saved in its subdirectory proxy
+    :param levels: number of levels of the pyramid
+    :param workers: number of threads
+    :return: proxy_src: path of the coarsest proxy relative to output_dir
+             proxy_scale: scale of the coarsest proxy relative to the source image
+    """
+    from skimage.io import imread, imsave
+
+    filenames = [proxy_filename(src_path, level) for level in range(1, levels + 1)]
+    paths = [os.path.join(output_dir, filename) for filename in filenames]
+    source_time = os.path.getmtime(src_path)
+    if not all(os.path.exists(path) and os.path.getmtime(path) >= source_time for path in paths):
+        try:
+            os.makedirs(os.path.join(output_dir, PROXY_DIR))
+        except OSError:  # exists already, maybe created by another worker
+            if not os.path.isdir(os.path.join(output_dir, PROXY_DIR)):
+                raise
+        for path, image in zip(paths, make_pyramid(imread(src_path), levels, workers)):
+            with warnings.catch_warnings():  # suppress "low contrast image" warning
+                warnings.simplefilter("ignore")
+                imsave(path, image)
+    return filenames[-1], 0.5 ** levels
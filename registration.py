@@ -0,0 +1,233 @@
+"""
+Registration of adjacent sections by the regions extracted by the operation features of process.py.
+
+Regions of a section are matched to the regions of the adjacent section by their nearest neighbours in a KD-tree over
+position and shape, all regions of a section are queried at once. Ambiguous matches are rejected by a ratio test and
+by requiring mutual nearest neighbours. The matched centroids give the polynomial Transform of Reconstruct by least
+squares (see SERIES.DTD and annotation.TransformAttrib):
+    x' = xcoef[0] + xcoef[1]*x + xcoef[2]*y + xcoef[3]*x*y + xcoef[4]*x*x + xcoef[5]*y*y
+    y' = ycoef[0] + ycoef[1]*x + ycoef[2]*y + ycoef[3]*x*y + ycoef[4]*x*x + ycoef[5]*y*y
+"""
+
+import os
+
+import numpy as np
+
+TRANSFORM_DIMS = [1, 2, 3, 4, 5, 6]
+REGISTRATION_COLUMNS = ['section', 'reference', 'regions', 'matches', 'dim', 'xcoef', 'ycoef', 'rms']
+
+
+def read_features(csv_filename):
+    """
+    Read the regions of a section as saved by the operation features of process.py.
+    :return: dataframe with the columns area, y0, x0, orientation, length, width, minr, minc, maxr, maxc
+    """
+    import pandas as pd
+    return pd.read_csv(csv_filename, index_col=0)
+
+
+def feature_points(table, pixel_size=1.0, image_height=None):
+    """
+    Centroids of the regions in micrometer.
+    :param table: regions of a section (see read_features)
+    :param pixel_size: width of a pixel in micrometer
+    :param image_height: height of the image in pixels, to invert the y axis as in sections exported by
+                         labels_to_contours; if None the y axis points down from the top row
+    :return: array of points (x, y) with shape (n, 2)
+    """
+    x = np.asarray(table['x0'], dtype=float)
+    y = np.asarray(table['y0'], dtype=float)
+    if image_height is not None:
+        y = image_height - 1 - y
+    return np.stack([x, y], axis=1) * pixel_size
+
+
+def feature_descriptors(table, pixel_size=1.0):
+    """
+    Shape of the regions in micrometer: square root of the area, length and width of the ellipse, and the orientation
+    as vector of length (length - width) / 2 at twice the angle, so elongated regions of similar orientation are close
+    and the orientation of round regions does not matter.
+    :return: array with shape (n, 5)
+    """
+    area = np.asarray(table['area'], dtype=float)
+    length = np.asarray(table['length'], dtype=float)
+    width = np.asarray(table['width'], dtype=float)
+    orientation = np.asarray(table['orientation'], dtype=float)
+    elongation = 0.5 * (length - width)
+    return np.stack([np.sqrt(area), length, width,
+                     elongation * np.cos(2 * orientation), elongation * np.sin(2 * orientation)], axis=1) * pixel_size
+
+
+class FeatureIndex(object):
+    """
+    KD-tree over the regions of a section, each region represented by its centroid and its weighted shape descriptors.
+    """
+
+    def __init__(self, points, descriptors, shape_weight=1.0):
+        """
+        :param points: centroids with shape (n, 2)
+        :param descriptors: shape descriptors with shape (n, m)
+        :param shape_weight: weight of the shape relative to the position
+        """
+        from scipy.spatial import cKDTree
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        descriptors = np.asarray(descriptors, dtype=float)
+        if descriptors.ndim == 1:   # a single descriptor of each region
+            descriptors = descriptors.reshape(-1, 1)
+        self.vectors = np.hstack([self.points, shape_weight * descriptors])   # also without regions, shape (0, m + 2)
+        self.tree = cKDTree(self.vectors)
+
+    @classmethod
+    def from_table(cls, table, pixel_size=1.0, image_height=None, shape_weight=1.0):
+        return cls(feature_points(table, pixel_size, image_height), feature_descriptors(table, pixel_size),
+                   shape_weight)
+
+    def __len__(self):
+        return len(self.points)
+
+    def query(self, vectors, k=2):
+        """
+        Nearest neighbours of all vectors at once.
+        :return: distances and indices with shape (n, k), missing neighbours have distance inf and index len(self)
+        """
+        vectors = np.asarray(vectors, dtype=float).reshape(-1, self.vectors.shape[1])
+        distances, indices = self.tree.query(vectors, k=k)
+        return distances.reshape(len(vectors), k), indices.reshape(len(vectors), k)
+
+
+def match_features(index, reference, ratio=0.8, max_distance=np.inf):
+    """
+    Match the regions of a section to the regions of the reference section.
+    A region is matched to its nearest neighbour in the reference, if the nearest neighbour is closer than ratio times
+    the second nearest neighbour, closer than max_distance, and the region is also the nearest neighbour of its match.
+    :param index: FeatureIndex of the section
+    :param reference: FeatureIndex of the reference section
+    :param ratio: maximal ratio of the distances to the nearest and the second nearest neighbour
+    :param max_distance: maximal distance of matched regions in micrometer (position and weighted shape)
+    :return: indices of the matched regions in the section and in the reference, arrays of the same length
+    """
+    if len(index) == 0 or len(reference) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    distances, neighbours = reference.query(index.vectors, k=2)
+    # without a second nearest neighbour (single region in the reference) its distance is inf and the test passes
+    accepted = (distances[:, 0] < ratio * distances[:, 1]) & (distances[:, 0] <= max_distance)
+    _, back = index.query(reference.vectors, k=1)
+    mutual = back[neighbours[:, 0], 0] == np.arange(len(index))
+    matched = np.flatnonzero(accepted & mutual)
+    return matched, neighbours[matched, 0]
+
+
+def transform_terms(points):
+    """
+    Terms of the polynomial transform: 1, x, y, x*y, x*x, y*y for each point.
+    :return: array with shape (n, 6)
+    """
+    x, y = points[:, 0], points[:, 1]
+    return np.stack([np.ones_like(x), x, y, x * y, x * x, y * y], axis=1)
+
+
+def fit_transform(points, target_points, dim=3):
+    """
+    Fit the Transform of Reconstruct that maps points to target_points by least squares.
+    dim 1: translation, dim 2: translation and scaling of each axis, dim 3: affine transform, dim 4-6: the first dim
+    terms of the polynomial (see module description).
+    :param points: array of points (x, y) with shape (n, 2)
+    :param target_points: array of corresponding points with shape (n, 2)
+    :param dim: number of terms of the transform
+    :return: xcoef, ycoef: lists of 6 coefficients
+    """
+    if dim not in TRANSFORM_DIMS:
+        raise ValueError("invalid transform dim %r, expected one of %s" % (dim, TRANSFORM_DIMS))
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    target_points = np.asarray(target_points, dtype=float).reshape(-1, 2)
+    if len(points) < dim:
+        raise ValueError("at least %d matched points are required for transform dim %d, got %d"
+                         % (dim, dim, len(points)))
+    terms = transform_terms(points)
+    xcoef, ycoef = np.zeros(6), np.zeros(6)
+    if dim == 1:
+        xcoef[:2] = [np.mean(target_points[:, 0] - points[:, 0]), 1]
+        ycoef[[0, 2]] = [np.mean(target_points[:, 1] - points[:, 1]), 1]
+    elif dim == 2:
+        xcoef[[0, 1]] = np.linalg.lstsq(terms[:, [0, 1]], target_points[:, 0], rcond=None)[0]
+        ycoef[[0, 2]] = np.linalg.lstsq(terms[:, [0, 2]], target_points[:, 1], rcond=None)[0]
+    else:
+        coefficients = np.linalg.lstsq(terms[:, :dim], target_points, rcond=None)[0]
+        xcoef[:dim], ycoef[:dim] = coefficients[:, 0], coefficients[:, 1]
+    return xcoef.tolist(), ycoef.tolist()
+
+
+def apply_transform(points, xcoef, ycoef):
+    """
+    Map points by the Transform of Reconstruct with the coefficients xcoef and ycoef.
+    """
+    terms = transform_terms(np.asarray(points, dtype=float).reshape(-1, 2))
+    return np.stack([terms.dot(xcoef), terms.dot(ycoef)], axis=1)
+
+
+def register_sections(csv_filename, reference_csv_filename, dim=3, ratio=0.8, max_distance=np.inf, pixel_size=1.0,
+                      image_height=None, shape_weight=1.0, iterations=2):
+    """
+    Fit the transform from a section to its reference section by their regions.
+    After the first fit the regions are matched again at their transformed positions, which finds more matches if the
+    sections are not well aligned.
+    :param csv_filename: regions of the section
+    :param reference_csv_filename: regions of the reference section
+    :param iterations: number of times the regions are matched and the transform is fitted
+    :return: dictionary with the columns REGISTRATION_COLUMNS, xcoef and ycoef are None if there are too few matches
+    """
+    table = read_features(csv_filename)
+    points, descriptors = feature_points(table, pixel_size, image_height), feature_descriptors(table, pixel_size)
+    reference = FeatureIndex.from_table(read_features(reference_csv_filename), pixel_size, image_height, shape_weight)
+    record = {'section': csv_filename, 'reference': reference_csv_filename, 'regions': len(points), 'matches': 0,
+              'dim': dim, 'xcoef': None, 'ycoef': None, 'rms': None}
+    moved_points = points
+    for _ in range(iterations):
+        index = FeatureIndex(moved_points, descriptors, shape_weight)
+        matched, reference_matched = match_features(index, reference, ratio, max_distance)
+        if len(matched) < dim:
+            break
+        target_points = reference.points[reference_matched]
+        xcoef, ycoef = fit_transform(points[matched], target_points, dim)
+        moved_points = apply_transform(points, xcoef, ycoef)
+        residuals = moved_points[matched] - target_points
+        record.update(matches=len(matched), xcoef=xcoef, ycoef=ycoef,
+                      rms=float(np.sqrt(np.mean(np.sum(residuals ** 2, axis=1)))))
+    return record
+
+
+def _register_pair(arguments):
+    """
+    Call register_sections with a tuple of arguments (for Pool.map).
+    """
+    return register_sections(*arguments)
+
+
+def section_order(csv_filename):
+    """
+    Sort key of the feature files by the section index, e.g. 12 for 12.csv, or by name if it is not a number.
+    """
+    name, _ = os.path.splitext(os.path.basename(csv_filename))
+    return (0, int(name), name) if name.isdigit() else (1, 0, name)
+
+
+def register_series(csv_filenames, dim=3, ratio=0.8, max_distance=np.inf, pixel_size=1.0, image_height=None,
+                    shape_weight=1.0, iterations=2, workers=1):
+    """
+    Register each section of a series to the previous section, the pairs of sections are processed in parallel.
+    :param csv_filenames: regions of the sections, sorted by section_order
+    :param workers: number of processes
+    :return: list of records of register_sections, one for each section except the first
+    """
+    csv_filenames = sorted(csv_filenames, key=section_order)
+    pairs = [(csv_filename, reference_csv_filename, dim, ratio, max_distance, pixel_size, image_height, shape_weight,
+              iterations)
+             for reference_csv_filename, csv_filename in zip(csv_filenames[:-1], csv_filenames[1:])]
+    if workers <= 1 or len(pairs) <= 1:
+        return [_register_pair(pair) for pair in pairs]
+    import multiprocessing
+    pool = multiprocessing.Pool(min(workers, len(pairs)))
+    try:
+        return pool.map(_register_pair, pairs)
+    finally:
+        pool.close()
@@ -0,0 +1,128 @@
+"""
+Compare two versions of a section at the contour level.
+
+Contours are grouped by name (that is by object), and each object is described by the hashes of the geometry of its
+contours. Only objects whose contours were added, removed or changed need to be rasterized again.
+"""
+
+import hashlib
+from collections import defaultdict
+
+import numpy as np
+
+try:  # python 2
+    from annotation import read_section, contours_to_label_dict, bbox
+except:  # python 3
+    from .annotation import read_section, contours_to_label_dict, bbox
+
+CHANGE_TYPES = ["added", "removed", "modified", "unchanged"]
+
+
+def geometry_hashes(points_list, decimals=6):
+    """
+    Hash the geometry of contours, all points are rounded together.
+    :param points_list: list of arrays of points with shape (n, 2)
+    :param decimals: number of decimals the coordinates are rounded to before hashing
+    :return: list of hex digests, one for each contour
+    """
+    lengths = [len(points) for points in points_list]
+    if not lengths:
+        return []
+    points = np.concatenate([np.asarray(points, dtype=float).reshape(-1, 2) for points in points_list])
+    points = np.round(points, decimals) + 0.0   # adding zero turns -0.0 into 0.0
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    return [hashlib.sha1(points[start:stop].tobytes()).hexdigest() for start, stop in zip(offsets[:-1], offsets[1:])]
+
+
+def object_signatures(contours, decimals=6):
+    """
+    Describe each object by the sorted hashes of its contours, independent of the order of the contours.
+    :param contours: list of contours (named tuples with attributes name and points)
+    :return: dictionary with sorted list of geometry hashes indexed by contour name
+    """
+    signatures = defaultdict(list)
+    for contour, digest in zip(contours, geometry_hashes([contour.points for contour in contours], decimals)):
+        signatures[contour.name].append(digest)
+    return {name: sorted(digests) for name, digests in signatures.items()}
+
+
+def diff_contours(old_contours, new_contours, decimals=6):
+    """
+    Compare two lists of contours by name and geometry.
+    :param old_contours: list of contours of the previous version
+    :param new_contours: list of contours of the current version
+    :param decimals: number of decimals the coordinates are compared with
+    :return: dictionary with a sorted list of object names for each change type (see CHANGE_TYPES)
+    """
+    old = object_signatures(old_contours, decimals)
+    new = object_signatures(new_contours, decimals)
+    changes = {change: [] for change in CHANGE_TYPES}
+    for name in sorted(set(old) | set(new)):
+        if name not in old:
+            changes["added"].append(name)
+        elif name not in new:
+            changes["removed"].append(name)
+        elif old[name] != new[name]:
+            changes["modified"].append(name)
+        else:
+            changes["unchanged"].append(name)
+    return changes
+
+
+def same_image_geometry(old_section, new_section):
+    """
+    Check whether the label images of two versions of a section have the same geometry, i.e. pixel size and domain.
+    :param old_section, new_section: tuples as returned by read_section
+    """
+    old_image, old_image_contour = old_section[1], old_section[2]
+    new_image, new_image_contour = new_section[1], new_section[2]
+    return (old_image.mag == new_image.mag and
+            bbox(np.asarray(old_image_contour.points)) == bbox(np.asarray(new_image_contour.points)))
+
+
+def as_section(xml_file):
+    """
+    Read a section unless it was read already.
+    :param xml_file: path or file object of a section xml file, or tuple as returned by read_section
+    :return: tuple as returned by read_section
+    """
+    return xml_file if isinstance(xml_file, tuple) else read_section(xml_file)
+
+
+def diff_sections(old_xml_filename, new_xml_filename, decimals=6):
+    """
+    Compare two versions of a section xml file.
+    Note: If the pixel size or domain of the image changed, all objects are reported as modified.
+    :param old_xml_filename: path of the previous version, if None all objects are reported as added
+    :param new_xml_filename: path of the current version, or the section already read (see as_section)
+    :return: dictionary with a sorted list of object names for each change type (see CHANGE_TYPES)
+    """
+    new_section = as_section(new_xml_filename)
+    if old_xml_filename is None:
+        return diff_contours([], new_section[4], decimals)
+
+    old_section = as_section(old_xml_filename)
+    changes = diff_contours(old_section[4], new_section[4], decimals)
+    if not same_image_geometry(old_section, new_section):
+        changes["modified"] = sorted(changes["modified"] + changes["unchanged"])
+        changes["unchanged"] = []
+    return changes
+
+
+def changed_label_dict(xml_filename, changes):
+    """
+    Rasterize only the objects that were added or modified.
+    :param xml_filename: path of the current version of the section, or the section already read (see as_section)
+    :param changes: dictionary as returned by diff_sections
+    :return: dictionary of label images with contour.name as key
+    """
+    section, image, image_contour, image_transform, contours, contours_transform = as_section(xml_filename)
+    assert image_transform.dim == 0 and contours_transform.dim == 0
+    return contours_to_label_dict(contours, image, image_contour, names=changes["added"] + changes["modified"])
+
+
+def changes_report(changes):
+    """
+    Flatten the changes into rows of (name, change), e.g. to be saved as csv file.
+    """
+    return [(name, change) for change in CHANGE_TYPES for name in changes[change]]
@@ -0,0 +1,200 @@
+"""
+Read and write section files compressed with gzip (.gz) or zstandard (.zst, requires the package zstandard), and
+series archived as tar (.tar, .tar.gz, .tgz, .tar.zst) or zip files.
+
+Compression is recognized by the extension, so "series.12.gz" is the section "series.12". Archives are read member by
+member as a stream, without extracting them to disk.
+"""
+
+import gzip
+import io
+import os
+import tarfile
+import time
+import zipfile
+
+COMPRESSIONS = [".gz", ".zst"]
+ARCHIVES = [".tar", ".tar.gz", ".tgz", ".tar.zst", ".zip"]
+
+
+def zstd_available():
+    """
+    Check whether zstandard compression is available (package zstandard).
+    """
+    try:
+        import zstandard
+    except ImportError:
+        return False
+    return True
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("reading or writing .zst files requires the package zstandard")
+    return zstandard
+
+
+def split_compression(filename):
+    """
+    Split the compression extension from a filename, e.g. ("series.12", ".gz") for "series.12.gz".
+    :return: filename without compression extension, compression extension or "" if not compressed
+    """
+    for compression in COMPRESSIONS:
+        if filename.endswith(compression):
+            return filename[:-len(compression)], compression
+    return filename, ""
+
+
+def split_archive(filename):
+    """
+    Split the archive extension from a filename, e.g. ("series", ".tar.gz") for "series.tar.gz".
+    :return: filename without archive extension, archive extension or "" if it is not an archive
+    """
+    for ext in ARCHIVES:
+        if filename.endswith(ext):
+            return filename[:-len(ext)], ext
+    return filename, ""
+
+
+def is_archive(filename):
+    """
+    Check whether the file is an archive of a series by its extension.
+    """
+    return split_archive(filename)[1] != ""
+
+
+def is_section(filename, prefix=""):
+    """
+    Check whether a file is a section of a series by its name, e.g. series.12 or series.12.gz for the prefix "series",
+    but not the series file series.ser or the images of the series.
+    """
+    name, ext = os.path.splitext(split_compression(os.path.basename(filename))[0])
+    return name.startswith(prefix) and ext[1:].isdigit()
+
+
+def find_section(filename):
+    """
+    Find a section file, either uncompressed or compressed, e.g. series.12, series.12.gz or series.12.zst.
+    :return: path of the existing file or None
+    """
+    for compression in [""] + COMPRESSIONS:
+        if os.path.exists(filename + compression):
+            return filename + compression
+    return None
+
+
+def open_section(filename, mode="rb"):
+    """
+    Open a section file, decompressed or compressed on the fly depending on its extension.
+    :param filename: path of the file, compressed if it ends with .gz or .zst
+    :param mode: "rb" or "wb"
+    :return: binary file object
+    """
+    _, compression = split_compression(filename)
+    if compression == ".gz":
+        return gzip.open(filename, mode)
+    if compression == ".zst":
+        zstandard = _zstd()
+        if "w" in mode:
+            return zstandard.ZstdCompressor().stream_writer(open(filename, mode), closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(open(filename, mode), closefd=True)
+    return open(filename, mode)
+
+
+def decompress(filename, data):
+    """
+    Decompress the content of a file depending on its extension, e.g. of a compressed member of an archive.
+    """
+    _, compression = split_compression(filename)
+    if compression == ".gz":
+        return gzip.GzipFile(fileobj=io.BytesIO(data)).read()
+    if compression == ".zst":
+        return _zstd().ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+    return data
+
+
+def write_section(filename, text):
+    """
+    Write the content of a section file, compressed if filename ends with .gz or .zst.
+    :param text: xml string
+    """
+    with open_section(filename, "wb") as f:
+        f.write(text.encode("utf-8") if not isinstance(text, bytes) else text)
+
+
+def iter_archive(filename, select=None):
+    """
+    Iterate over the files of an archive, one member at a time.
+    Members compressed by themselves (e.g. series.12.gz) are decompressed, and their name is returned without the
+    compression extension.
+    :param filename: path of a tar or zip archive
+    :param select: function called with the name of each member in turn, only members for which it returns True are
+                   read (e.g. workqueue.shard_selector), if None all members are read
+    :return: generator of member name and content (bytes)
+    """
+    if filename.endswith(".zip"):
+        with zipfile.ZipFile(filename) as archive:
+            for info in archive.infolist():
+                if not info.filename.endswith("/") and (select is None or select(info.filename)):
+                    yield split_compression(info.filename)[0], decompress(info.filename, archive.read(info))
+        return
+
+    if filename.endswith(".tar.zst"):
+        stream = _zstd().ZstdDecompressor().stream_reader(open(filename, "rb"), closefd=True)
+    else:
+        stream = open(filename, "rb")
+    with stream, tarfile.open(fileobj=stream, mode="r|*") as archive:   # stream, no random access
+        for member in archive:
+            if member.isfile() and (select is None or select(member.name)):
+                data = archive.extractfile(member).read()
+                yield split_compression(member.name)[0], decompress(member.name, data)
+
+
+class ArchiveWriter(object):
+    """
+    Write the sections of a series into a single tar or zip archive, one member at a time.
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: path of the archive, the format is given by the extension (see ARCHIVES)
+        """
+        if not is_archive(filename):
+            raise ValueError("unknown archive format %r, expected one of %s" % (filename, ARCHIVES))
+        self.filename = filename
+        self._stream = None
+        if filename.endswith(".zip"):
+            self._archive = zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED)
+        elif filename.endswith(".tar.zst"):
+            self._stream = _zstd().ZstdCompressor().stream_writer(open(filename, "wb"), closefd=True)
+            self._archive = tarfile.open(fileobj=self._stream, mode="w|")
+        else:
+            self._archive = tarfile.open(filename, "w|gz" if filename.endswith("gz") else "w|")
+
+    def add(self, name, text):
+        """
+        Add a file to the archive.
+        :param name: name of the member, e.g. series.12
+        :param text: content of the file
+        """
+        data = text.encode("utf-8") if not isinstance(text, bytes) else text
+        if isinstance(self._archive, zipfile.ZipFile):
+            self._archive.writestr(name, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = time.time()
+            self._archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self._archive.close()
+        if self._stream is not None:
+            self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,177 @@
+"""
+Smoothing and subdivision of closed contours.
+
+The kernels work on all contours of a section at once: the points of the contours are concatenated into a single
+array and an array of offsets marks where each contour starts, see concatenate_contours. All contours are closed,
+therefore neighbours of a point wrap around within its own contour.
+"""
+
+import numpy as np
+
+SMOOTHING_METHODS = ["bspline", "chaikin", "gaussian"]
+
+
+def concatenate_contours(points_list):
+    """
+    Concatenate the points of several closed contours into a single array.
+    Note: A last point repeating the first point (as returned by find_contours) is dropped.
+    :param points_list: list of arrays of points with shape (n, 2)
+    :return: points: array of shape (N, 2) containing the points of all contours
+             offsets: array of K+1 indices, the points of the k-th contour are points[offsets[k]:offsets[k+1]]
+    """
+    arrays = []
+    for points in points_list:
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if len(points) > 1 and np.array_equal(points[0], points[-1]):
+            points = points[:-1]
+        arrays.append(points)
+    offsets = np.concatenate([[0], np.cumsum([len(points) for points in arrays])]).astype(int)
+    points = np.concatenate(arrays) if arrays else np.zeros((0, 2))
+    return points, offsets
+
+
+def split_contours(points, offsets):
+    """
+    Split concatenated points into a list of arrays, one for each contour (inverse of concatenate_contours).
+    """
+    return [points[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+
+
+def cyclic_neighbours(offsets, shifts):
+    """
+    Return the indices of the neighbours of each point along its own closed contour.
+    :param offsets: start indices of the contours as returned by concatenate_contours
+    :param shifts: list of shifts, e.g. [-1, 1] for the previous and next point
+    :return: array of shape (N, len(shifts)) with the indices of the neighbours
+    """
+    lengths = np.diff(offsets)
+    starts = np.repeat(offsets[:-1], lengths)[:, None]
+    sizes = np.repeat(lengths, lengths)[:, None]
+    index = np.arange(offsets[-1])[:, None]
+    return starts + (index - starts + np.asarray(shifts)[None, :]) % sizes
+
+
+def bspline_subdivide(points, offsets, degree=3):
+    """
+    One step of uniform B-spline subdivision of closed contours (Lane-Riesenfeld algorithm), doubling the number
+    of points. Degree 1 inserts the midpoints, degree 2 is Chaikin's corner cutting, degree 3 the cubic B-spline.
+    :param points: concatenated points of all contours
+    :param offsets: start indices of the contours
+    :param degree: degree of the B-spline
+    :return: points, offsets of the subdivided contours
+    """
+    points = np.repeat(points, 2, axis=0)
+    offsets = offsets * 2
+    following = cyclic_neighbours(offsets, [1])[:, 0]
+    for _ in range(degree):
+        points = 0.5 * (points + points[following])
+    return points, offsets
+
+
+def chaikin(points, offsets):
+    """
+    One step of Chaikin's corner cutting of closed contours, i.e. quadratic B-spline subdivision.
+    """
+    return bspline_subdivide(points, offsets, degree=2)
+
+
+def resample_contours(points, offsets, spacing):
+    """
+    Resample closed contours at equal distances along the contour, the points are interpolated linearly between the
+    original points, so corners of the contours may be cut.
+    :param points: concatenated points of all contours
+    :param offsets: start indices of the contours
+    :param spacing: maximal distance between the resampled points, each contour keeps at least 3 points
+    :return: points, offsets of the resampled contours
+    """
+    lengths = np.diff(offsets)
+    if len(points) == 0:
+        return points, offsets
+    following = points[cyclic_neighbours(offsets, [1])[:, 0]]
+    distances = np.hypot(*(following - points).T)
+    arc = np.concatenate([[0], np.cumsum(distances)])
+    perimeters = arc[offsets[1:]] - arc[offsets[:-1]]
+    counts = np.where(perimeters > 0, np.maximum(np.ceil(perimeters / spacing), 3), lengths).astype(int)
+
+    # arc length of the resampled points from the start of all contours
+    contours = np.repeat(np.arange(len(counts)), counts)
+    index = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    positions = arc[offsets[contours]] + index * (perimeters / np.maximum(counts, 1))[contours]
+    edges = np.clip(np.searchsorted(arc, positions, side='right') - 1, offsets[contours],
+                    np.maximum(offsets[contours + 1] - 1, offsets[contours]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fractions = np.where(distances[edges] > 0, (positions - arc[edges]) / distances[edges], 0)
+    points = points[edges] + fractions[:, None] * (following[edges] - points[edges])
+    return points, np.concatenate([[0], np.cumsum(counts)]).astype(int)
+
+
+def gaussian_smooth(points, offsets, sigma=1.0, truncate=4.0, spacing=None):
+    """
+    Smooth closed contours by a Gaussian filter along the contour. The contours are resampled at equal distances
+    first (see resample_contours), so the filter does not depend on the number of points of a contour, e.g. after
+    simplification.
+    Note: Like any low pass filter this shrinks the contours, noticeably where the radius of curvature is not much
+          larger than sigma, and contours with a perimeter of a few sigma collapse.
+    :param points: concatenated points of all contours
+    :param offsets: start indices of the contours
+    :param sigma: standard deviation of the Gaussian kernel as distance along the contour (in units of the points)
+    :param truncate: truncate the kernel at this many standard deviations
+    :param spacing: distance of the resampled points, if None sigma
+    :return: points, offsets of the smoothed contours
+    """
+    points, offsets = resample_contours(points, offsets, sigma if spacing is None else spacing)
+    if len(points) == 0:
+        return points, offsets
+    lengths = np.diff(offsets)
+    distances = np.hypot(*(points[cyclic_neighbours(offsets, [1])[:, 0]] - points).T)
+    perimeters = np.where(lengths > 0, np.add.reduceat(distances, np.minimum(offsets[:-1], len(points) - 1)), 0)
+    # standard deviation in number of points of each contour, with the actual distance of its resampled points
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scales = np.where(perimeters > 0, sigma * lengths / perimeters, 0)
+    scales = np.repeat(scales, lengths)
+    radius = min(max(int(truncate * scales.max() + 0.5), 1), lengths.max())
+    shifts = np.arange(-radius, radius + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.exp(-0.5 * (shifts[None, :] / scales[:, None]) ** 2)
+    weights[scales == 0] = shifts == 0
+    weights /= weights.sum(axis=1, keepdims=True)
+    neighbours = cyclic_neighbours(offsets, shifts)
+    points = np.einsum('nkd,nk->nd', points[neighbours], weights)
+    return points, offsets
+
+
+def smooth_loops(loops, method="chaikin", iterations=1, degree=3, sigma=1.0):
+    """
+    Smooth a list of closed contours, all contours are processed together.
+    :param loops: list of arrays of points with shape (n, 2), a last point repeating the first point is dropped
+    :param method: "bspline" (subdivision), "chaikin" (corner cutting) or "gaussian" (filter along contour)
+    :param iterations: number of times the smoothing is applied
+    :param degree: degree of the B-spline (only for method "bspline")
+    :param sigma: standard deviation in units of the points (only for method "gaussian", see gaussian_smooth)
+    :return: list of arrays of smoothed points
+    """
+    points, offsets = concatenate_contours(loops)
+    for _ in range(iterations):
+        if method == "bspline":
+            points, offsets = bspline_subdivide(points, offsets, degree=degree)
+        elif method == "chaikin":
+            points, offsets = chaikin(points, offsets)
+        elif method == "gaussian":
+            points, offsets = gaussian_smooth(points, offsets, sigma=sigma)
+        else:
+            raise ValueError("invalid smoothing method: %s" % method)
+    return split_contours(points, offsets)
+
+
+def smooth_contours(contours, method="chaikin", iterations=1, degree=3, sigma=1.0):
+    """
+    Smooth the points of a list of contours, all contours are processed together.
+    :param contours: list of contours (named tuples with the attribute points, see annotation.ContourAttrib)
+    :param method: "bspline" (subdivision), "chaikin" (corner cutting) or "gaussian" (filter along contour)
+    :param iterations: number of times the smoothing is applied
+    :param degree: degree of the B-spline (only for method "bspline")
+    :param sigma: standard deviation in units of the points (only for method "gaussian", see gaussian_smooth)
+    :return: list of contours with smoothed points
+    """
+    smoothed = smooth_loops([contour.points for contour in contours], method, iterations, degree, sigma)
+    return [contour._replace(points=contour_points) for contour, contour_points in zip(contours, smoothed)]
@@ -1,7 +1,11 @@
-from io import StringIO
+import shutil
+import tempfile
+from io import BytesIO, StringIO
 from unittest import TestCase
 
 from annotation import *
+from tracing import opencv_available
+from skimage.io import imread
 
 # Print results on console or make figures with matplotlib
 from pprint import pprint
@@ -175,6 +179,91 @@ class TestPNGIO(TestCase):
         self.assertEqual(verify_files(xml_file, open(SECTION_DTD_FILENAME, 'r')), True)
 
 
+class TestRoundTrip(TestCase):
+
+    def make_example_label_dict_with_holes(self):
+        label = np.zeros((60, 80))
+        label[5:50, 5:70] = 1        # object
+        label[10:40, 10:40] = 0      # with a hole
+        label[20:30, 20:30] = 1      # and an island within the hole
+        label[45:55, 60:75] = 1      # overlapping the image border
+        other = np.zeros((60, 80))
+        other[0:3, 0:80] = 1          # at the image border
+        return {'dendrite': label, 'axon': other}
+
+    def test_contour_holes(self):
+        label_dict = self.make_example_label_dict_with_holes()
+        for kwargs in [dict(tracing="border_following"), dict(tracing="marching_squares", smoothing="chaikin")]:
+            contours = labels_to_contours(label_dict, 0.005, **kwargs)
+            holes = [contour.comment == "hole" for contour in contours]
+            self.assertEqual(sum(holes), 1)
+            self.assertEqual(list(contour_holes(contours)), holes)
+            hole = contours[holes.index(True)]
+            self.assertEqual(hole.name, 'dendrite')
+            self.assertGreater(np.ptp(hole.points[:, 0]), 0.005 * 20)   # the hole (30 pixels), not the island (10)
+
+    def test_smoothing_size(self):
+        square = np.zeros((80, 80))
+        square[10:70, 10:70] = 1    # 60 pixels, simplified to 4 points at tolerance 5
+        pixel = np.zeros((5, 5))
+        pixel[2, 2] = 1             # traced as a contour of 4 points
+        for smoothing in ["gaussian", "chaikin"]:
+            contour, = labels_to_contours({'dendrite': square}, 0.005, smoothing=smoothing)
+            np.testing.assert_allclose(np.ptp(contour.points, axis=0), 0.005 * 60, rtol=0.02)
+            contour, = labels_to_contours({'dendrite': pixel}, 0.005, smoothing=smoothing, tolerance=0)
+            self.assertGreaterEqual(len(contour.points), 4)
+
+    def test_label_to_xml_to_label(self):
+        """
+        Convert labels to xml at tolerance 0 and back, the labels must be unchanged with the tracing methods along
+        the pixel edges.
+        """
+        label_dict = self.make_example_label_dict_with_holes()
+        for tracing in ["border_following"] + (["opencv"] if opencv_available() else []):
+            e = label_dict_to_xml_str(label_dict=label_dict,
+                                      image_shape=(60, 80),
+                                      image_filename='missing.png',
+                                      pixel_size=0.005,
+                                      section_thickness=0.012,
+                                      section_index=1,
+                                      tolerance=0,
+                                      tracing=tracing)
+            temp_dir = tempfile.mkdtemp()
+            try:
+                xml_filename = os.path.join(temp_dir, 'series.1')
+                with open(xml_filename, 'w') as f:
+                    f.write(e)
+                labels, source_image = xml_to_label_dict(xml_filename)
+            finally:
+                shutil.rmtree(temp_dir)
+
+            self.assertEqual(sorted(labels.keys()), ['axon', 'dendrite'])
+            for name, label in label_dict.items():
+                np.testing.assert_array_equal(labels[name], label, err_msg=tracing)
+
+
+
+class TestNumberFormat(TestCase):
+
+    def test_significant_digits(self):
+        points = np.array([[0.1234567891, 2.0], [1234.56789, 1e-7]])
+        self.assertEqual(convert_attribute_to_string('points', points, 6), "0.123457 2, 1234.57 1e-07")
+        self.assertEqual(convert_attribute_to_string('points', points[:1], 3), "0.123 2")
+        self.assertEqual(convert_attribute_to_string('points', np.zeros((0, 2)), 6), "")
+        self.assertEqual(convert_attribute_to_string('xcoef', [0, 1.00000001, 0, 0, 0, 0], 6), "0 1 0 0 0 0")
+        self.assertEqual(convert_attribute_to_string('xcoef', [0, 1, 0, 0, 0, 0]), "0 1 0 0 0 0")
+        self.assertEqual(convert_attribute_to_string('thickness', 0.05, 6), "0.05")
+        self.assertRaises(ValueError, format_numbers, points, -1)
+
+    def test_significant_digits_round_trip(self):
+        """
+        Coordinates read back from the xml differ by less than the precision.
+        """
+        contours = [ExampleDendriteContour._replace(points=np.random.RandomState(0).rand(100, 2) * 50)]
+        e = dict_to_xml_str(make_section_dict(contours=contours, significant_digits=6))
+        points = read_section(BytesIO(e))[4][0].points
+        np.testing.assert_allclose(points, contours[0].points, rtol=5e-6)
+
 # TODO: Empty contour list
 
 # TODO: # Include the DCOTYPE in the second line of the XML
@@ -0,0 +1,17 @@
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+
+class TestImports(TestCase):
+
+    def test_lazy_imports(self):
+        """
+        Importing the modules of process.py must not import multiprocessing, pandas or skimage (see benchmark startup).
+        """
+        tools_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = ("import sys; sys.path.insert(0, %r); "
+                "import proxy, annotation, section_diff, workqueue, section_io, registration; "
+                "print(' '.join(m for m in ['multiprocessing', 'pandas', 'skimage'] if m in sys.modules))" % tools_dir)
+        self.assertEqual(subprocess.check_output([sys.executable, "-c", code]).strip(), b"")
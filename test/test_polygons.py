@@ -0,0 +1,74 @@
+from unittest import TestCase
+
+import numpy as np
+
+from polygons import *
+
+
+SQUARE = np.array([[0, 0], [10, 0], [10, 10], [0, 10]], dtype=float)
+HOLE = np.array([[2, 2], [2, 8], [8, 8], [8, 2]], dtype=float)     # clockwise
+ISLAND = np.array([[4, 4], [6, 4], [6, 6], [4, 6]], dtype=float)
+OTHER = SQUARE + 20
+
+
+class TestPolygons(TestCase):
+
+    def test_signed_areas(self):
+        np.testing.assert_allclose(signed_areas([SQUARE, HOLE, ISLAND]), [100, -36, 4])
+
+    def test_points_in_polygons(self):
+        inside = points_in_polygons([[5, 5], [1, 1], [25, 25]], [SQUARE, HOLE, OTHER], block_size=4)
+        np.testing.assert_array_equal(inside, [[True, True, False], [True, False, False], [False, False, True]])
+
+    def test_polygon_hierarchy(self):
+        depths, parents = polygon_hierarchy([ISLAND, OTHER, SQUARE, HOLE])
+        self.assertEqual(list(depths), [2, 0, 0, 1])
+        self.assertEqual(list(parents), [3, -1, -1, 2])
+
+    def test_polygon_hierarchy_many(self):
+        """
+        Many nested and separate squares, the depths equal the number of containing polygons of the midpoints.
+        """
+        random = np.random.RandomState(3)
+        corners = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=float)
+        loops = [corners * size + offset for offset in random.rand(100, 2) * 100 for size in [0.5, 1, 2, 4]]
+        loops = [loop + 1e-3 * random.rand() for loop in loops] + [np.zeros((0, 2))]
+        depths, parents = polygon_hierarchy(loops)
+        midpoints = [0.5 * (loop[0] + loop[1]) for loop in loops[:-1]]
+        inside = points_in_polygons(midpoints, loops[:-1])
+        np.fill_diagonal(inside, False)
+        np.testing.assert_array_equal(depths[:-1], inside.sum(axis=1))
+        self.assertEqual((depths[-1], parents[-1]), (0, -1))
+
+    def test_fill_even_odd(self):
+        mask = fill_even_odd([SQUARE + 0.5, HOLE + 0.5, ISLAND + 0.5], (12, 12))
+        expected = np.zeros((12, 12), dtype=bool)
+        expected[1:11, 1:11] = True
+        expected[3:9, 3:9] = False
+        expected[5:7, 5:7] = True
+        np.testing.assert_array_equal(mask, expected)
+
+    def test_fill_even_odd_random(self):
+        random = np.random.RandomState(1)
+        rows, columns = np.mgrid[0:20, 0:20]
+        centers = np.stack([rows.ravel(), columns.ravel()], axis=1)
+        for _ in range(10):
+            loops = [random.rand(6, 2) * 30 - 5 for _ in range(2)]   # self-intersecting, partially outside
+            mask = fill_even_odd(loops, (20, 20))
+            expected = np.logical_xor(*points_in_polygons(centers, loops).T).reshape(20, 20)
+            np.testing.assert_array_equal(mask, expected)
+
+    def test_empty(self):
+        self.assertFalse(fill_even_odd([], (3, 3)).any())
+        depths, parents = polygon_hierarchy([])
+        self.assertEqual(len(depths), 0)
+
+    def test_approximate_polygons(self):
+        from skimage.measure import approximate_polygon
+        random = np.random.RandomState(2)
+        angles = np.linspace(0, 2 * np.pi, 200)
+        circle = np.stack([np.cos(angles), np.sin(angles)], axis=1) * 20
+        loops = [circle, random.rand(50, 2) * 10, random.rand(2, 2), np.cumsum(random.rand(300, 2) - 0.5, axis=0)]
+        for tolerance in [0, 0.5, 2]:
+            for loop, approximated in zip(loops, approximate_polygons(loops, tolerance)):
+                np.testing.assert_array_equal(approximated, approximate_polygon(loop, tolerance))
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+import numpy as np
+from skimage.io import imread, imsave
+
+from proxy import *
+
+
+class TestPyramid(TestCase):
+
+    def test_block_mean(self):
+        image = np.arange(20, dtype=np.uint8).reshape(4, 5)
+        reduced = block_mean(image)
+        self.assertEqual(reduced.shape, (2, 3))
+        self.assertEqual(reduced.dtype, np.uint8)
+        self.assertEqual(reduced[0, 0], 3)     # mean of 0, 1, 5, 6 rounded
+        self.assertEqual(reduced[1, 2], 16)    # last column padded: mean of 14, 14, 19, 19 rounded to even
+
+    def test_block_mean_color(self):
+        image = np.ones((6, 6, 3)) * [0.0, 0.5, 1.0]
+        reduced = block_mean(image, factor=3)
+        np.testing.assert_allclose(reduced, np.ones((2, 2, 3)) * [0.0, 0.5, 1.0])
+
+    def test_parallel(self):
+        image = np.random.RandomState(0).randint(0, 255, (101, 64)).astype(np.uint8)
+        np.testing.assert_array_equal(block_mean_parallel(image, 2, workers=4), block_mean(image, 2))
+
+    def test_make_pyramid(self):
+        pyramid = make_pyramid(np.zeros((100, 60)), 3, workers=2)
+        self.assertEqual([level.shape for level in pyramid], [(50, 30), (25, 15), (13, 8)])
+
+
+class TestWriteProxies(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.src_path = os.path.join(self.temp_dir, '1.png')
+        imsave(self.src_path, np.random.RandomState(0).randint(0, 255, (64, 48)).astype(np.uint8))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_write_proxies(self):
+        proxy_src, proxy_scale = write_proxies(self.src_path, self.temp_dir, 2)
+        self.assertEqual(proxy_src, os.path.join('proxy', '1.2.png'))
+        self.assertEqual(proxy_scale, 0.25)
+        proxy_path = os.path.join(self.temp_dir, proxy_src)
+        self.assertEqual(imread(proxy_path).shape, (16, 12))
+
+        # reuse proxies of an unchanged image
+        modified = os.path.getmtime(proxy_path)
+        write_proxies(self.src_path, self.temp_dir, 2)
+        self.assertEqual(os.path.getmtime(proxy_path), modified)
+
+        # update proxies of a changed image
+        future = time.time() + 10
+        os.utime(self.src_path, (future, future))
+        write_proxies(self.src_path, self.temp_dir, 2)
+        self.assertNotEqual(os.path.getmtime(proxy_path), modified)
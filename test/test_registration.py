@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from registration import *
+
+
+def make_table(points, seed=0):
+    """
+    Regions at the points (x, y) in pixels with random shapes, columns as saved by the operation features.
+    """
+    random = np.random.RandomState(seed)
+    length = random.uniform(5, 30, len(points))
+    width = length * random.uniform(0.3, 1, len(points))
+    return pd.DataFrame({'area': np.pi / 4 * length * width, 'y0': points[:, 1], 'x0': points[:, 0],
+                         'orientation': random.uniform(-np.pi / 2, np.pi / 2, len(points)),
+                         'length': length, 'width': width},
+                        columns=['area', 'y0', 'x0', 'orientation', 'length', 'width'])
+
+
+class TestTransform(TestCase):
+
+    def test_fit_transform(self):
+        points = np.random.RandomState(0).uniform(0, 100, (50, 2))
+        for dim in TRANSFORM_DIMS:
+            xcoef = [3, 1.01, 0.02, 1e-4, 2e-4, -1e-4][:dim] + [0] * (6 - dim)
+            ycoef = [-2, -0.03, 0.98, -1e-4, 1e-4, 3e-4][:dim] + [0] * (6 - dim)
+            if dim == 1:
+                xcoef[1], ycoef[2] = 1, 1
+            if dim == 2:
+                ycoef[1], ycoef[2] = 0, 0.98
+            fitted_xcoef, fitted_ycoef = fit_transform(points, apply_transform(points, xcoef, ycoef), dim)
+            np.testing.assert_allclose(fitted_xcoef, xcoef, atol=1e-9)
+            np.testing.assert_allclose(fitted_ycoef, ycoef, atol=1e-9)
+
+    def test_fit_transform_invalid(self):
+        points = np.zeros((2, 2))
+        self.assertRaises(ValueError, fit_transform, points, points, 0)
+        self.assertRaises(ValueError, fit_transform, points, points, 3)   # too few points
+
+
+class TestMatching(TestCase):
+
+    def setUp(self):
+        random = np.random.RandomState(1)
+        self.points = random.uniform(0, 1000, (200, 2))
+        self.xcoef, self.ycoef = [2, 0.999, 0.005, 0, 0, 0], [-3, -0.005, 0.999, 0, 0, 0]
+        self.moved = apply_transform(self.points, self.xcoef, self.ycoef)
+        self.table = make_table(self.points)
+        self.moved_table = make_table(self.moved)
+        for column in ['area', 'orientation', 'length', 'width']:   # same regions in the adjacent section
+            self.moved_table[column] = self.table[column]
+
+    def test_match_features(self):
+        order = np.random.RandomState(2).permutation(len(self.points))
+        index = FeatureIndex.from_table(self.table)
+        reference = FeatureIndex.from_table(self.moved_table.iloc[order])
+        matched, reference_matched = match_features(index, reference)
+        self.assertGreater(len(matched), 150)
+        np.testing.assert_array_equal(order[reference_matched], matched)   # all matches are correct
+
+        # ambiguous regions are rejected by the ratio test
+        matched, _ = match_features(index, FeatureIndex.from_table(self.table.iloc[[0, 0]]))
+        self.assertEqual(len(matched), 0)
+
+    def test_register_empty(self):
+        """
+        Sections without regions (empty feature files) are not registered, but do not stop the series.
+        """
+        temp_dir = tempfile.mkdtemp()
+        try:
+            csv_filenames = [os.path.join(temp_dir, name) for name in ["1.csv", "2.csv", "3.csv"]]
+            for csv_filename, table in zip(csv_filenames, [self.table, self.table.iloc[:0], self.table]):
+                table.to_csv(csv_filename)
+            records = register_series(csv_filenames, dim=3)
+            self.assertEqual([(record['regions'], record['matches'], record['xcoef']) for record in records],
+                             [(0, 0, None), (len(self.points), 0, None)])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_register_series(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            # section 2 is mapped to section 1 by the transform, section 10 is identical to section 2
+            csv_filenames = [os.path.join(temp_dir, name) for name in ["10.csv", "2.csv", "1.csv"]]
+            for csv_filename, table in zip(csv_filenames, [self.table, self.table, self.moved_table]):
+                table.to_csv(csv_filename)
+            for workers in [1, 2]:
+                records = register_series(csv_filenames, dim=3, workers=workers)
+                self.assertEqual([(os.path.basename(record['section']), os.path.basename(record['reference']))
+                                  for record in records], [("2.csv", "1.csv"), ("10.csv", "2.csv")])
+                np.testing.assert_allclose(records[0]['xcoef'], self.xcoef, atol=1e-9)
+                np.testing.assert_allclose(records[0]['ycoef'], self.ycoef, atol=1e-9)
+                np.testing.assert_allclose(records[1]['xcoef'], [0, 1, 0, 0, 0, 0], atol=1e-9)
+                self.assertLess(records[0]['rms'], 1e-9)
+        finally:
+            shutil.rmtree(temp_dir)
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from section_diff import *
+from annotation import ExampleDendriteContour
+
+
+EXAMPLE_SECTION_FILENAME = os.path.dirname(__file__) + '/xml_example/newSeries.373.xml'
+
+SQUARE = np.array([[0, 0], [4, 0], [4, 4], [0, 4]], dtype=float)
+TRIANGLE = np.array([[10, 10], [16, 10], [13, 15]], dtype=float)
+
+
+def make_contour(name, points):
+    return ExampleDendriteContour._replace(name=name, points=points)
+
+
+class TestDiffContours(TestCase):
+
+    def test_geometry_hashes(self):
+        hashes = geometry_hashes([SQUARE, SQUARE + 1e-9, -0.0 * SQUARE, TRIANGLE])
+        self.assertEqual(hashes[0], hashes[1])   # equal after rounding
+        self.assertNotEqual(hashes[0], hashes[3])
+        self.assertEqual(geometry_hashes([]), [])
+
+    def test_diff_contours(self):
+        old = [make_contour('a', SQUARE), make_contour('b', TRIANGLE), make_contour('c', SQUARE)]
+        new = [make_contour('d', SQUARE), make_contour('a', SQUARE), make_contour('b', TRIANGLE + 1)]
+        changes = diff_contours(old, new)
+        self.assertEqual(changes, {'added': ['d'], 'removed': ['c'], 'modified': ['b'], 'unchanged': ['a']})
+
+    def test_order_of_contours_ignored(self):
+        old = [make_contour('a', SQUARE), make_contour('a', TRIANGLE)]
+        new = [make_contour('a', TRIANGLE), make_contour('a', SQUARE)]
+        self.assertEqual(diff_contours(old, new)['unchanged'], ['a'])
+
+
+class TestDiffSections(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_diff_sections(self):
+        self.assertEqual(diff_sections(EXAMPLE_SECTION_FILENAME, EXAMPLE_SECTION_FILENAME)['unchanged'], ['dendrite1'])
+        self.assertEqual(diff_sections(None, EXAMPLE_SECTION_FILENAME)['added'], ['dendrite1'])
+
+        # rename the dendrite in a copy of the section
+        renamed_filename = os.path.join(self.temp_dir, 'newSeries.373')
+        with open(renamed_filename, 'w') as f:
+            f.write(open(EXAMPLE_SECTION_FILENAME).read().replace('"dendrite1"', '"dendrite2"'))
+        changes = diff_sections(EXAMPLE_SECTION_FILENAME, renamed_filename)
+        self.assertEqual(changes['added'], ['dendrite2'])
+        self.assertEqual(changes['removed'], ['dendrite1'])
+        self.assertEqual(changes_report(changes), [('dendrite2', 'added'), ('dendrite1', 'removed')])
+
+        labels = changed_label_dict(renamed_filename, changes)
+        self.assertEqual(list(labels.keys()), ['dendrite2'])
+
+        # a section read once is used for the comparison and the labels
+        section = read_section(renamed_filename)
+        self.assertEqual(diff_sections(EXAMPLE_SECTION_FILENAME, section), changes)
+        self.assertEqual(list(changed_label_dict(section, changes).keys()), ['dendrite2'])
@@ -0,0 +1,94 @@
+import gzip
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+from unittest import TestCase, skipIf
+
+from annotation import read_section, verify, xml_to_label_dict, SECTION_DTD_FILENAME
+from section_io import *
+
+EXAMPLE_SECTION_FILENAME = os.path.dirname(__file__) + '/xml_example/newSeries.373.xml'
+
+
+class TestCompression(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        with open(EXAMPLE_SECTION_FILENAME, 'rb') as f:
+            self.data = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_split_compression(self):
+        self.assertEqual(split_compression("series.12.gz"), ("series.12", ".gz"))
+        self.assertEqual(split_compression("series.12.zst"), ("series.12", ".zst"))
+        self.assertEqual(split_compression("series.12"), ("series.12", ""))
+        self.assertTrue(is_archive("series.tar.gz"))
+        self.assertTrue(is_archive("series.zip"))
+        self.assertFalse(is_archive("series.12.gz"))
+        self.assertEqual(split_archive("data/series.tar.gz"), ("data/series", ".tar.gz"))
+
+    def test_is_section(self):
+        for filename in ["series.12", "data/series.12.gz", "series.12.zst"]:
+            self.assertTrue(is_section(filename, "series"), filename)
+        for filename in ["series.ser", "image0373.tif", "other.12", "series.12.xml"]:
+            self.assertFalse(is_section(filename, "series"), filename)
+
+    def check_compressed_section(self, compression):
+        filename = os.path.join(self.temp_dir, "series.373" + compression)
+        write_section(filename, self.data)
+        self.assertEqual(find_section(os.path.join(self.temp_dir, "series.373")), filename)
+        self.assertTrue(verify(filename, SECTION_DTD_FILENAME))
+        contours = read_section(filename)[4]
+        self.assertEqual([contour.name for contour in contours],
+                         [contour.name for contour in read_section(EXAMPLE_SECTION_FILENAME)[4]])
+        return filename
+
+    def test_gzip(self):
+        filename = self.check_compressed_section(".gz")
+        with gzip.open(filename) as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertLess(os.path.getsize(filename), len(self.data))
+
+    @skipIf(not zstd_available(), "zstandard not installed")
+    def test_zstd(self):
+        self.check_compressed_section(".zst")
+
+    def test_file_object(self):
+        labels, _ = xml_to_label_dict(io.BytesIO(self.data))
+        expected_labels, _ = xml_to_label_dict(EXAMPLE_SECTION_FILENAME)
+        self.assertEqual(sorted(labels.keys()), sorted(expected_labels.keys()))
+
+
+class TestArchive(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.sections = [("series.%d" % index, "<Section index=\"%d\"/>" % index) for index in range(1, 4)]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_write_and_read(self):
+        for name in ["series.tar", "series.tar.gz", "series.zip"]:
+            filename = os.path.join(self.temp_dir, name)
+            with ArchiveWriter(filename) as archive:
+                for member_name, text in self.sections:
+                    archive.add(member_name, text)
+            self.assertEqual([(member_name, data.decode("utf-8")) for member_name, data in iter_archive(filename)],
+                             self.sections)
+        self.assertRaises(ValueError, ArchiveWriter, os.path.join(self.temp_dir, "series.rar"))
+
+    def test_compressed_members(self):
+        filename = os.path.join(self.temp_dir, "series.tar")
+        with tarfile.open(filename, "w") as archive:
+            for member_name, text in self.sections:
+                data = gzip.compress(text.encode("utf-8"))
+                info = tarfile.TarInfo("series/" + member_name + ".gz")
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        self.assertEqual([(member_name, data.decode("utf-8")) for member_name, data in iter_archive(filename)],
+                         [("series/" + member_name, text) for member_name, text in self.sections])
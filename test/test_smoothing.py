@@ -0,0 +1,92 @@
+from unittest import TestCase
+
+import numpy as np
+
+from smoothing import *
+from annotation import ExampleDendriteContour
+
+
+SQUARE = np.array([[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]], dtype=float)   # closed, last point repeats first
+TRIANGLE = np.array([[10, 10], [16, 10], [13, 15]], dtype=float)
+
+
+class TestConcatenate(TestCase):
+
+    def test_concatenate_and_split(self):
+        points, offsets = concatenate_contours([SQUARE, TRIANGLE])
+        self.assertEqual(list(offsets), [0, 4, 7])   # closing point of the square dropped
+        square, triangle = split_contours(points, offsets)
+        np.testing.assert_array_equal(square, SQUARE[:-1])
+        np.testing.assert_array_equal(triangle, TRIANGLE)
+
+    def test_cyclic_neighbours(self):
+        _, offsets = concatenate_contours([SQUARE, TRIANGLE])
+        neighbours = cyclic_neighbours(offsets, [-1, 1])
+        self.assertEqual(list(neighbours[:, 0]), [3, 0, 1, 2, 6, 4, 5])
+        self.assertEqual(list(neighbours[:, 1]), [1, 2, 3, 0, 5, 6, 4])
+
+
+class TestSmoothing(TestCase):
+
+    def test_chaikin(self):
+        points, offsets = concatenate_contours([SQUARE])
+        points, offsets = chaikin(points, offsets)
+        self.assertEqual(len(points), 8)
+        np.testing.assert_allclose(points[:2], [[1, 0], [3, 0]])   # corners cut at 1/4 and 3/4
+
+    def test_bspline_subdivide(self):
+        points, offsets = concatenate_contours([SQUARE, TRIANGLE])
+        for _ in range(3):
+            points, offsets = bspline_subdivide(points, offsets, degree=3)
+        self.assertEqual(list(offsets), [0, 32, 56])
+        square, triangle = split_contours(points, offsets)
+        self.assertTrue(np.all((square > 0) & (square < 4)))   # the curve lies within the convex hull
+        np.testing.assert_allclose(square.mean(axis=0), [2, 2])
+
+    def test_resample_contours(self):
+        points, offsets = concatenate_contours([SQUARE, TRIANGLE, [[1, 1]]])
+        points, offsets = resample_contours(points, offsets, spacing=0.5)
+        self.assertEqual(list(np.diff(offsets)), [32, 36, 1])   # perimeter / spacing, a single point is kept
+        square, triangle, point = split_contours(points, offsets)
+        np.testing.assert_allclose(square[:3], [[0, 0], [0.5, 0], [1, 0]])
+        np.testing.assert_allclose(point, [[1, 1]])
+
+    def test_gaussian_smooth(self):
+        angles = np.linspace(0, 2 * np.pi, 40, endpoint=False)
+        circle = 10 * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+        noisy = circle * (1 + 0.05 * (-1) ** np.arange(40))[:, None]
+        points, offsets = concatenate_contours([noisy, TRIANGLE])
+        points, offsets = gaussian_smooth(points, offsets, sigma=2)
+        circle_smooth, triangle_smooth = split_contours(points, offsets)
+        radius = np.hypot(circle_smooth[:, 0], circle_smooth[:, 1])
+        self.assertLess(radius.std(), 0.05)
+        self.assertGreater(radius.mean(), 9.5)
+        self.assertTrue(np.all((triangle_smooth.min(axis=0) > [10, 10]) & (triangle_smooth.max(axis=0) < [16, 15])))
+
+    def test_gaussian_smooth_distance(self):
+        """
+        Sigma is a distance along the contour, independent of the number of points, e.g. after simplification.
+        """
+        square = 60 * SQUARE
+        dense = np.concatenate([np.linspace(a, b, 60, endpoint=False) for a, b in zip(square[:-1], square[1:])])
+        results = []
+        for contour in [square, dense]:
+            points, offsets = gaussian_smooth(*concatenate_contours([contour]), sigma=1)
+            results.append(points)
+            np.testing.assert_allclose(np.ptp(points, axis=0), [240, 240], atol=1)   # only the corners are rounded
+        np.testing.assert_allclose(results[0], results[1], atol=1e-9)
+
+    def test_batch_equals_single(self):
+        points, offsets = concatenate_contours([SQUARE, TRIANGLE])
+        points, offsets = gaussian_smooth(points, offsets, sigma=1.5)
+        single, single_offsets = concatenate_contours([TRIANGLE])
+        single, _ = gaussian_smooth(single, single_offsets, sigma=1.5)
+        np.testing.assert_allclose(split_contours(points, offsets)[1], single)
+
+    def test_smooth_contours(self):
+        contours = [ExampleDendriteContour._replace(points=SQUARE),
+                    ExampleDendriteContour._replace(points=TRIANGLE)]
+        smoothed = smooth_contours(contours, method="bspline", iterations=2)
+        self.assertEqual([len(contour.points) for contour in smoothed], [16, 12])
+        self.assertEqual(smoothed[0].name, contours[0].name)
+        self.assertRaises(ValueError, smooth_contours, contours, method="unknown")
@@ -0,0 +1,87 @@
+from unittest import TestCase, skipIf
+
+import numpy as np
+
+from polygons import fill_even_odd
+from tracing import *
+
+
+def make_example_mask():
+    mask = np.zeros((30, 40), dtype=bool)
+    mask[2:20, 3:25] = True     # square with a hole
+    mask[6:12, 8:15] = False
+    mask[8:10, 10:12] = True    # island within the hole
+    mask[25, 30] = True         # single pixel
+    mask[26, 31] = True         # touching the single pixel only diagonally
+    return mask
+
+
+def fill_loops(loops, shape):
+    """
+    Rasterize loops (x, y) as returned by trace_contours with polygons.fill_even_odd, as contours_to_label_dict does.
+    """
+    return fill_even_odd([np.stack([shape[0] - 1 - loop[:, 1], loop[:, 0]], axis=1) for loop in loops], shape)
+
+
+class TestTracing(TestCase):
+
+    def test_border_following(self):
+        mask = make_example_mask()
+        loops, holes = trace_contours(mask, method="border_following")
+        self.assertEqual(len(loops), 5)
+        self.assertEqual(holes.sum(), 1)
+        np.testing.assert_array_equal(fill_loops(loops, mask.shape), mask)
+
+    def test_border_following_random(self):
+        random = np.random.RandomState(0)
+        for _ in range(5):
+            mask = random.rand(40, 30) > 0.5
+            loops, holes = trace_contours(mask, method="border_following")
+            np.testing.assert_array_equal(fill_loops(loops, mask.shape), mask)
+            np.testing.assert_array_equal(signed_areas(loops) < 0, holes)
+
+    def test_same_as_marching_squares(self):
+        mask = make_example_mask()
+        loops, holes = trace_contours(mask, level=0.5, method="marching_squares")
+        border_loops, border_holes = trace_contours(mask, level=0.5, method="border_following")
+        self.assertEqual(sorted(holes), sorted(border_holes))
+        # polygons differ by at most half a pixel at the corners
+        centers = sorted(tuple(np.round(loop.mean(axis=0))) for loop in loops)
+        border_centers = sorted(tuple(np.round(loop.mean(axis=0))) for loop in border_loops)
+        self.assertEqual(centers, border_centers)
+
+    def test_signed_areas(self):
+        square = np.array([[0, 0], [2, 0], [2, 2], [0, 2]])
+        np.testing.assert_allclose(signed_areas([square, square[::-1], square[:0]]), [4, -4, 0])
+
+    def test_empty(self):
+        loops, holes = trace_contours(np.zeros((5, 5)), method="border_following")
+        self.assertEqual((loops, len(holes)), ([], 0))
+
+    @skipIf(not opencv_available(), "OpenCV not installed")
+    def test_opencv(self):
+        mask = make_example_mask()
+        loops, holes = trace_contours(mask, method="opencv")
+        self.assertEqual(len(loops), 4)   # OpenCV traces 8-connected regions
+        self.assertEqual(holes.sum(), 1)
+        np.testing.assert_array_equal(fill_loops(loops, mask.shape), mask)
+
+    @skipIf(not opencv_available(), "OpenCV not installed")
+    def test_same_as_border_following(self):
+        mask = np.zeros((8, 8), dtype=bool)
+        mask[1:5, 1:3] = True    # L-shape with a concave corner
+        mask[3:5, 1:6] = True
+        loops, holes = trace_contours(mask, method="opencv")
+        border_loops, border_holes = trace_contours(mask, method="border_following")
+        self.assertEqual(len(loops), 1)
+        self.assertEqual(sorted(map(tuple, loops[0])), sorted(map(tuple, border_loops[0])))
+        self.assertEqual(signed_areas(loops)[0], signed_areas(border_loops)[0])
+
+    @skipIf(not opencv_available(), "OpenCV not installed")
+    def test_opencv_random(self):
+        random = np.random.RandomState(0)
+        for _ in range(5):
+            mask = random.rand(40, 30) > 0.5
+            loops, holes = trace_contours(mask, method="opencv")
+            np.testing.assert_array_equal(fill_loops(loops, mask.shape), mask)
+            np.testing.assert_array_equal(signed_areas(loops) < 0, holes)
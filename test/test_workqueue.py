@@ -0,0 +1,134 @@
+import csv
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from workqueue import *
+
+
+PATHS = ["series.%d" % index for index in range(20)]
+
+
+def work(queue_dir, results_dir):
+    """
+    Claim and process files like an invocation of process.py, processing is marked by an empty file.
+    """
+    queue = WorkQueue(queue_dir)
+    for path in PATHS:
+        if queue.claim(path):
+            open(os.path.join(results_dir, "%s.%d" % (path, os.getpid())), "w").close()
+            time.sleep(0.001)
+            queue.complete(path)
+
+
+def work_and_report(queue_dir, report_filename):
+    """
+    Claim and process files, and write the report if all files are finished, like an invocation of process.py.
+    """
+    queue = WorkQueue(queue_dir)
+    for path in PATHS:
+        if queue.claim(path):
+            queue.complete(path)
+    if queue.is_finished(PATHS):
+        queue.write_report(report_filename)
+
+
+class TestShard(TestCase):
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("2/4"), (2, 4))
+        for text in ["4/4", "-1/4", "1", "a/b"]:
+            self.assertRaises(ValueError, parse_shard, text)
+
+    def test_shard(self):
+        shards = [shard(reversed(PATHS), index, 3) for index in range(3)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(PATHS))
+        self.assertEqual(shards[0], shard(PATHS, 0, 3))
+
+    def test_shard_selector(self):
+        selections = [[path for path in sorted(PATHS) if selector(path)]
+                      for selector in [shard_selector(index, 3) for index in range(3)]]
+        self.assertEqual(selections, [shard(PATHS, index, 3) for index in range(3)])
+
+
+class TestWorkQueue(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.queue_dir = os.path.join(self.temp_dir, QUEUE_DIR)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_claim_and_complete(self):
+        queue = WorkQueue(self.queue_dir)
+        self.assertTrue(queue.claim("input/series.1"))
+        self.assertFalse(queue.claim("input/series.1"))   # claimed
+        queue.complete("input/series.1", "failed", 1.5, "error")
+        self.assertFalse(queue.claim("input/series.1"))   # done
+        records = queue.report()
+        self.assertEqual([(record["path"], record["status"]) for record in records], [("input/series.1", "failed")])
+
+        report_filename = os.path.join(self.temp_dir, "report.csv")
+        write_report(records, report_filename)
+        self.assertEqual(open(report_filename).readline().strip(), ",".join(REPORT_COLUMNS))
+
+        # the report is written once all files are done and none is claimed
+        self.assertTrue(queue.is_finished(["input/series.1"]))
+        self.assertTrue(queue.claim("input/series.2"))
+        self.assertFalse(queue.is_finished(["input/series.1"]))
+        queue.complete("input/series.2")
+        self.assertTrue(queue.is_finished(["input/series.1", "input/series.2"]))
+        self.assertEqual(len(queue.write_report(report_filename)), 2)
+
+    def test_stale_claim(self):
+        queue = WorkQueue(self.queue_dir, stale_timeout=60)
+        self.assertTrue(queue.claim("series.1"))
+        self.assertFalse(queue.claim("series.1"))
+        past = time.time() - 120
+        os.utime(os.path.join(self.queue_dir, "series.1.lock"), (past, past))
+        self.assertTrue(queue.claim("series.1"))   # recovered
+        self.assertEqual(sorted(os.listdir(self.queue_dir)), ["series.1.lock"])
+
+    def test_heartbeat(self):
+        queue = WorkQueue(self.queue_dir, stale_timeout=0.2)
+        self.assertTrue(queue.claim("series.1"))
+        with queue.heartbeat("series.1", interval=0.02):
+            time.sleep(0.5)   # longer than the stale timeout
+            self.assertFalse(WorkQueue(self.queue_dir, stale_timeout=0.2).claim("series.1"))
+        queue.complete("series.1")
+        self.assertEqual(sorted(os.listdir(self.queue_dir)), ["series.1.done"])
+
+    def test_several_processes(self):
+        results_dir = os.path.join(self.temp_dir, "results")
+        os.makedirs(results_dir)
+        workers = [multiprocessing.Process(target=work, args=(self.queue_dir, results_dir)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        processed = sorted(filename.rsplit(".", 1)[0] for filename in os.listdir(results_dir))
+        self.assertEqual(processed, sorted(PATHS))   # every file processed exactly once
+        self.assertEqual(len(WorkQueue(self.queue_dir).report()), len(PATHS))
+
+    def test_several_processes_report(self):
+        """
+        Invocations that finish at the same time write the report, which must list every file exactly once.
+        """
+        report_filename = os.path.join(self.temp_dir, "run_report.csv")
+        for _ in range(5):
+            shutil.rmtree(self.queue_dir, ignore_errors=True)
+            workers = [multiprocessing.Process(target=work_and_report, args=(self.queue_dir, report_filename))
+                       for _ in range(4)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            with open(report_filename) as f:
+                rows = list(csv.DictReader(f))
+            self.assertEqual(sorted(row["path"] for row in rows), sorted(PATHS))
+            self.assertEqual(set(row["status"] for row in rows), {"done"})
+            self.assertFalse(os.path.exists(report_filename + ".lock"))
@@ -0,0 +1,211 @@
+"""
+Tracing of the boundaries of regions in label images.
+
+All tracing methods return the same kind of polygons, so they can be used interchangeably by labels_to_contours:
+- coordinates (x, y) in pixels with the origin in the center of the lower left pixel and the y axis pointing
+  upwards, as used by Reconstruct (after multiplication with the pixel size)
+- the first point is not repeated at the end
+- outer boundaries are counterclockwise, holes are clockwise
+
+Methods:
+- "marching_squares": skimage.measure.find_contours with sub-pixel interpolation at the given level
+- "border_following": boundaries along the pixel edges of the binary mask (image > level), exact for any label image
+- "opencv": cv2.findContours along the pixel edges, the same polygons as border_following except that regions touching
+  diagonally are traced as one polygon (only if OpenCV is installed)
+"""
+
+import numpy as np
+
+try:  # python 2
+    from smoothing import split_contours, cyclic_neighbours
+    from polygons import signed_areas
+except:  # python 3
+    from .smoothing import split_contours, cyclic_neighbours
+    from .polygons import signed_areas
+
+TRACING_METHODS = ["marching_squares", "border_following", "opencv"]
+
+# Directions of the pixel edges as steps in (row, column), turning left means counterclockwise on screen
+UP, LEFT, DOWN, RIGHT = 0, 1, 2, 3
+STEPS = np.array([[-1, 0], [0, -1], [1, 0], [0, 1]])
+
+
+def opencv_available():
+    """
+    Check whether the optional OpenCV (cv2) can be imported, which is needed for the tracing method "opencv".
+    """
+    try:
+        import cv2
+    except ImportError:
+        return False
+    return True
+
+
+def trace_contours(image, level=0, method="marching_squares"):
+    """
+    Trace the boundaries of the regions with values above level.
+    :param image: label image
+    :param level: value of the boundary, regions are image > level
+    :param method: tracing method (see TRACING_METHODS)
+    :return: loops: list of arrays of points (x, y) in pixels
+             holes: boolean array, True for loops that are the boundary of a hole
+    """
+    image = np.asarray(image)
+    rows, columns = np.nonzero(image > level)
+    if len(rows) == 0:
+        return [], np.zeros(0, dtype=bool)
+
+    # crop to the bounding box of the regions (with a margin of one pixel for find_contours)
+    minr, minc = max(rows.min() - 1, 0), max(columns.min() - 1, 0)
+    maxr, maxc = rows.max() + 2, columns.max() + 2
+    crop = image[minr:maxr, minc:maxc]
+
+    if method == "marching_squares":
+        loops = trace_marching_squares(crop, level)
+    elif method == "border_following":
+        loops = trace_border_following(crop > level)
+    elif method == "opencv":
+        loops = trace_opencv(crop > level)
+    else:
+        raise ValueError("invalid tracing method: %s" % method)
+
+    # (row, column) in the crop to (x, y) in the image, y axis upwards
+    height = image.shape[0]
+    loops = [np.stack([loop[:, 1] + minc, height - 1 - (loop[:, 0] + minr)], axis=1) for loop in loops]
+    holes = signed_areas(loops) < 0
+    return loops, holes
+
+
+def trace_marching_squares(image, level):
+    """
+    Trace boundaries with marching squares on the zero padded image.
+    :return: list of loops of points (row, column), reversed such that the foreground is on the left on screen,
+             which becomes the counterclockwise orientation of outer boundaries once the y axis points upwards
+    """
+    from skimage.measure import find_contours
+    padded = np.pad(image.astype(float), 1, mode='constant')
+    loops = []
+    for loop in find_contours(padded, level):
+        if len(loop) > 1 and np.array_equal(loop[0], loop[-1]):
+            loop = loop[:-1]
+        loops.append(loop[::-1] - 1)
+    return loops
+
+
+def trace_border_following(mask):
+    """
+    Trace boundaries along the edges between foreground and background pixels.
+    The boundary edges of all regions are linked into loops at once: each edge points to its successor and the
+    loops are separated and ordered by pointer jumping. Regions are 4-connected (as for marching squares).
+    :param mask: binary image
+    :return: list of loops of points (row, column) at the pixel corners, see trace_marching_squares for orientation
+    """
+    padded = np.pad(mask.astype(bool), 1, mode='constant')
+    height, width = padded.shape
+
+    # the four pixels around each inner corner of the padded image
+    nw, ne, sw, se = padded[:-1, :-1], padded[:-1, 1:], padded[1:, :-1], padded[1:, 1:]
+    exists = np.zeros((4, height + 1, width + 1), dtype=bool)
+    exists[UP, 1:-1, 1:-1] = nw & ~ne      # right edge of a foreground pixel
+    exists[LEFT, 1:-1, 1:-1] = sw & ~nw    # top edge
+    exists[DOWN, 1:-1, 1:-1] = se & ~sw    # left edge
+    exists[RIGHT, 1:-1, 1:-1] = ne & ~se   # bottom edge
+
+    directions, corner_rows, corner_columns = np.nonzero(exists)
+    number = len(directions)
+    edge_ids = -np.ones(exists.shape, dtype=np.int32 if exists.size < 2 ** 31 else np.int64)
+    edge_ids[directions, corner_rows, corner_columns] = np.arange(number)
+
+    # successor at the end corner: turn left if possible, else go straight, else turn right
+    end_rows = corner_rows + STEPS[directions, 0]
+    end_columns = corner_columns + STEPS[directions, 1]
+    successors = edge_ids[(directions + 1) % 4, end_rows, end_columns]
+    for turn in [0, 3]:
+        candidates = edge_ids[(directions + turn) % 4, end_rows, end_columns]
+        successors = np.where(successors < 0, candidates, successors)
+
+    # label each loop by its smallest edge id
+    labels = np.arange(number)
+    jumps = successors.copy()
+    for _ in range(int(np.ceil(np.log2(max(number, 2))))):
+        labels = np.minimum(labels, labels[jumps])
+        jumps = jumps[jumps]
+
+    # rank the edges by their distance to the last edge of the loop, which precedes the smallest edge
+    last = labels[successors] == successors
+    jumps = np.where(last, np.arange(number), successors)
+    distances = np.where(last, 0, 1)
+    for _ in range(int(np.ceil(np.log2(max(number, 2))))):
+        distances = distances + distances[jumps]
+        jumps = jumps[jumps]
+
+    # order the edges along each loop (foreground on the left on screen, as for trace_marching_squares)
+    order = np.lexsort((-distances, labels))
+    offsets = np.concatenate([[0], np.flatnonzero(np.diff(labels[order])) + 1, [number]])
+
+    # keep only the corners where the direction changes
+    ordered_directions = directions[order]
+    previous = cyclic_neighbours(offsets, [-1])[:, 0]
+    turns = ordered_directions != ordered_directions[previous]
+    corners = order[turns]
+    corner_offsets = np.concatenate([[0], np.cumsum(turns)])[offsets]
+
+    # corners of the padded image to pixel coordinates of the unpadded image
+    points = np.stack([corner_rows[corners] - 1.5, corner_columns[corners] - 1.5], axis=1)
+    return split_contours(points, corner_offsets)
+
+
+def corner_mask(mask):
+    """
+    Upsample a binary image by two, such that pixel centers, edges and corners of the image become pixels: pixel
+    (i, j) is set if the point ((i - 1) / 2, (j - 1) / 2) belongs to a foreground pixel, including its edges.
+    The boundary pixels of the result are therefore the pixel edges of the foreground.
+    :param mask: binary image of shape (h, w)
+    :return: binary image of shape (2h + 1, 2w + 1)
+    """
+    height, width = mask.shape
+    corners = np.zeros((2 * height + 1, 2 * width + 1), dtype=bool)
+    for dr in range(3):
+        for dc in range(3):
+            corners[dr:dr + 2 * height:2, dc:dc + 2 * width:2] |= mask
+    return corners
+
+
+def restore_corners(loop):
+    """
+    Replace the diagonal steps, by which 8-connected border following cuts the concave corners of the boundary in
+    corner_mask, by the pixel corners, and remove the points at the middle of pixel edges.
+    :param loop: array of points (row, column) in corner_mask, where pixel corners have even coordinates
+    :return: array of points at the pixel corners
+    """
+    following = np.roll(loop, -1, axis=0)
+    diagonal = np.flatnonzero(np.all(loop != following, axis=1))
+    p, q = loop[diagonal], following[diagonal]
+    even = (p[:, :1] % 2 == 0) & (q[:, 1:] % 2 == 0)
+    corners = np.where(even, np.stack([p[:, 0], q[:, 1]], axis=1), np.stack([q[:, 0], p[:, 1]], axis=1))
+    loop = np.insert(loop, diagonal + 1, corners, axis=0)
+    return loop[np.all(loop % 2 == 0, axis=1)]
+
+
+def trace_opencv(mask):
+    """
+    Trace boundaries with cv2.findContours (border following by Suzuki and Abe) along the pixel edges: the boundary
+    pixels are traced in corner_mask(mask), where they are at the pixel edges of mask.
+    :param mask: binary image
+    :return: list of loops of points (row, column), see trace_marching_squares for orientation
+    """
+    try:
+        import cv2
+    except ImportError:
+        raise ImportError("tracing method opencv requires OpenCV (cv2)")
+    result = cv2.findContours(corner_mask(mask).astype(np.uint8), cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    contours, hierarchy = result[-2:]   # OpenCV 3 returns the image as first value
+    loops = []
+    for index, contour in enumerate(contours):
+        loop = (restore_corners(contour[:, 0, ::-1]) - 1) / 2.0   # (x, y) in corner_mask to (row, column) in mask
+        area = signed_areas([loop])[0]   # positive in (row, column) for foreground on the left on screen
+        is_hole = hierarchy[0][index][3] >= 0
+        if (area > 0) == is_hole:
+            loop = loop[::-1]
+        loops.append(loop)
+    return loops
@@ -0,0 +1,251 @@
+"""
+Distribute the files of a series over many independent invocations of process.py, e.g. on the machines of a cluster
+sharing a file system but without a scheduler.
+
+- Sharding: each invocation processes a fixed part of the files, given as --shard i/N.
+- Work queue: invocations claim files by atomically creating lock files in a directory shared by all invocations.
+  Finished files are marked by done files, which are merged into a report by the invocation that finishes last.
+  Claims of invocations that died are considered stale after a timeout and can be claimed again, the claims of
+  running invocations are renewed regularly while a file is processed (see WorkQueue.heartbeat).
+"""
+
+import csv
+import errno
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+
+try:  # python 3, replaces existing files also on Windows
+    from os import replace
+except ImportError:  # python 2, os.rename replaces existing files on POSIX
+    from os import rename as replace
+
+QUEUE_DIR = "queue"
+REPORT_COLUMNS = ["path", "status", "seconds", "host", "pid", "finished", "error"]
+
+
+def parse_shard(text):
+    """
+    Parse a shard given as "i/N", the i-th of N shards (starting with 0).
+    :return: index, count
+    """
+    try:
+        index, count = [int(number) for number in text.split("/")]
+    except ValueError:
+        raise ValueError("invalid shard %r, expected i/N" % text)
+    if not 0 <= index < count:
+        raise ValueError("invalid shard %r, expected 0 <= i < N" % text)
+    return index, count
+
+
+def shard_selector(index, count):
+    """
+    Select the files of the index-th of count shards from a sequence of files, which must be the same for all
+    invocations, e.g. the members of an archive read as a stream.
+    :return: function that is called with each file of the sequence in turn, True if it belongs to the shard
+    """
+    positions = itertools.count()
+    return lambda path: next(positions) % count == index
+
+
+def shard(paths, index, count):
+    """
+    Return the part of the paths for the index-th of count shards. The shards of all invocations cover all paths.
+    """
+    selected = shard_selector(index, count)
+    return [path for path in sorted(paths) if selected(path)]
+
+
+class WorkQueue(object):
+    """
+    Work queue based on lock files: <name>.lock while a file is processed, <name>.done when it is finished.
+    Note: The name of a file is its basename, which must be unique within the series.
+    """
+
+    def __init__(self, directory, stale_timeout=3600):
+        """
+        :param directory: queue directory shared by all invocations
+        :param stale_timeout: seconds after which a claim is considered stale, e.g. because its invocation died
+        """
+        self.directory = directory
+        self.stale_timeout = stale_timeout
+        try:
+            os.makedirs(directory)
+        except OSError:  # exists already, maybe created by another invocation
+            if not os.path.isdir(directory):
+                raise
+
+    def _path(self, src_path, ext):
+        return os.path.join(self.directory, os.path.basename(src_path) + ext)
+
+    def is_done(self, src_path):
+        return os.path.exists(self._path(src_path, ".done"))
+
+    def claim(self, src_path):
+        """
+        Claim a file for processing.
+        :return: True if the file was claimed, False if it is done or claimed by another invocation
+        """
+        if self.is_done(src_path):
+            return False
+        lock_path = self._path(src_path, ".lock")
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            if self.is_stale(lock_path) and self._break(lock_path):
+                return self.claim(src_path)
+            return False
+        with os.fdopen(fd, "w") as f:
+            json.dump({"host": socket.gethostname(), "pid": os.getpid(), "claimed": time.time()}, f)
+        if self.is_done(src_path):  # finished by another invocation just before the claim
+            os.remove(lock_path)
+            return False
+        return True
+
+    def is_stale(self, lock_path):
+        try:
+            return time.time() - os.path.getmtime(lock_path) > self.stale_timeout
+        except OSError:  # released meanwhile
+            return False
+
+    def _break(self, lock_path):
+        """
+        Remove a stale lock. Only one invocation succeeds in renaming the lock file, and a lock that was claimed
+        again between the check and the renaming is put back.
+        """
+        broken_path = "%s.%s.%d.stale" % (lock_path, socket.gethostname(), os.getpid())
+        try:
+            os.rename(lock_path, broken_path)
+        except OSError:  # broken by another invocation
+            return False
+        if not self.is_stale(broken_path):
+            try:
+                os.link(broken_path, lock_path)   # fails if the file was claimed again meanwhile
+            except OSError:
+                pass
+            os.remove(broken_path)
+            return False
+        os.remove(broken_path)
+        return True
+
+    def heartbeat(self, src_path, interval=None):
+        """
+        Renew the claim of a file while it is processed, so files that take longer than the stale timeout are not
+        claimed by other invocations, e.g. with heartbeat(src_path): process(src_path)
+        :param interval: seconds between renewals, if None a quarter of the stale timeout
+        :return: Heartbeat
+        """
+        return Heartbeat(self._path(src_path, ".lock"), self.stale_timeout / 4.0 if interval is None else interval)
+
+    def complete(self, src_path, status="done", seconds=0.0, error=None):
+        """
+        Mark a claimed file as finished and release the claim.
+        :param status: e.g. "done" or "failed"
+        :param seconds: processing time
+        :param error: description of the error, if any
+        """
+        record = {"path": src_path, "status": status, "seconds": seconds, "host": socket.gethostname(),
+                  "pid": os.getpid(), "finished": time.time(), "error": error}
+        done_path = self._path(src_path, ".done")
+        temp_path = "%s.%s.%d.tmp" % (done_path, socket.gethostname(), os.getpid())
+        with open(temp_path, "w") as f:
+            json.dump(record, f)
+        replace(temp_path, done_path)   # atomic, the done file is never seen incomplete
+        try:
+            os.remove(self._path(src_path, ".lock"))
+        except OSError:  # claim was broken as stale meanwhile
+            pass
+
+    def is_finished(self, src_paths):
+        """
+        Check whether all files are done and no file is claimed by any invocation.
+        """
+        return (all(self.is_done(src_path) for src_path in src_paths) and
+                not any(filename.endswith(".lock") for filename in os.listdir(self.directory)))
+
+    def write_report(self, filename, timeout=60):
+        """
+        Merge the records of all finished files into a csv file. The report is written under a lock, so the records
+        are collected and written by one invocation at a time and a report is never replaced by an older one.
+        :param filename: path of the report
+        :param timeout: seconds after which the lock of another invocation is considered stale
+        :return: list of records (see report)
+        """
+        lock_path = filename + ".lock"
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            try:
+                if time.time() - os.path.getmtime(lock_path) > timeout:
+                    os.remove(lock_path)   # left by an invocation that died while writing
+            except OSError:   # released meanwhile
+                pass
+            time.sleep(0.01)
+        try:
+            records = self.report()
+            write_report(records, filename)
+        finally:
+            os.remove(lock_path)
+        return records
+
+    def report(self):
+        """
+        Collect the records of all finished files of all invocations.
+        :return: list of dictionaries, sorted by path
+        """
+        records = []
+        for filename in sorted(os.listdir(self.directory)):
+            if filename.endswith(".done"):
+                with open(os.path.join(self.directory, filename)) as f:
+                    records.append(json.load(f))
+        return sorted(records, key=lambda record: record["path"])
+
+
+class Heartbeat(object):
+    """
+    Touch a lock file regularly in a background thread, as long as the context is entered.
+    """
+
+    def __init__(self, lock_path, interval):
+        self.lock_path = lock_path
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                os.utime(self.lock_path, None)
+            except OSError:   # released meanwhile
+                pass
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stopped.set()
+        self._thread.join()
+
+
+def write_report(records, filename):
+    """
+    Save the records of the finished files as csv file. The file is replaced at once, it is never seen incomplete.
+    """
+    temp_path = "%s.%s.%d.tmp" % (filename, socket.gethostname(), os.getpid())
+    with open(temp_path, "w") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS)
+        writer.writeheader()
+        for record in records:
+            writer.writerow(record)
+    replace(temp_path, filename)   # atomic, an existing report is replaced